@@ -0,0 +1,319 @@
+import io
+import numpy as np
+import pandas as pd
+from grptavutils import write_parquet
+from grptavutils.constants import Fields, Storage
+from grptavutils.session import get_session
+
+# (major group, family group, items, price range)
+FAMILIES = [
+    ("BEVERAGE", "Vini calice", 20, (6, 12)),
+    ("BEVERAGE", "Vini rossi", 40, (25, 90)),
+    ("BEVERAGE", "Vini bianchi", 30, (22, 70)),
+    ("BEVERAGE", "Bollicine", 15, (30, 120)),
+    ("BEVERAGE", "Bibite", 12, (3, 5)),
+    ("BEVERAGE", "Caffetteria", 10, (1, 4)),
+    ("FOOD", "Aperitivi", 10, (6, 14)),
+    ("FOOD", "Antipasti", 20, (9, 18)),
+    ("FOOD", "Primi", 25, (12, 22)),
+    ("FOOD", "Secondi", 25, (18, 35)),
+    ("FOOD", "Contorni", 10, (5, 8)),
+    ("FOOD", "Pane", 3, (2, 4)),
+    ("FOOD", "Dolci", 12, (6, 10)),
+    ("FOOD", "Menu", 4, (45, 90)),
+]
+
+FIRST_NAMES = ["MARCO", "GIULIA", "LUCA", "FRANCESCA", "ANDREA", "CHIARA", "MATTEO", "SARA", "DAVIDE", "ELENA"]
+LAST_NAMES = ["rossi", "bianchi", "ferrari", "esposito", "romano", "colombo", "ricci", "marino", None]
+
+GA_CHANNELS = {
+    "Organic Search": ["google", "bing", "yahoo", "duckduckgo"],
+    "Direct": ["(direct)"],
+    "Social": ["facebook.com", "instagram.com", "l.instagram.com", "m.facebook.com"],
+    "Referral": ["thefork.it", "tripadvisor.it", "sevenrooms.com", "gamberorosso.it"],
+    "Paid Search": ["google"],
+    "Email": ["newsletter"],
+}
+
+RESERVATION_STATUSES = ["CONFIRMED", "COMPLETE", "CANCELED", "NO_SHOW"]
+RESERVATION_TAGS = ["Occasion: Birthday", "Guest: VIP", "Dietary: Vegetarian", None, None, None]
+NOTES = ["tavolo vicino alla finestra", "seggiolone", "allergia al glutine", None, None, None, None, None]
+
+
+class SyntheticData:
+    """Daily Oracle, GA and SevenRooms exports for a chain of restaurants.
+
+    rows_per_location is the number of employee x item rows of an Oracle
+    Employee export, checks_per_location the guest checks of a Guest export.
+    """
+
+    def __init__(self, locations, rows_per_location=250, checks_per_location=120, reservations_per_location=60,
+                 seed=0):
+        self.locations = np.arange(1, locations + 1)
+        self.rows_per_location = rows_per_location
+        self.checks_per_location = checks_per_location
+        self.reservations_per_location = reservations_per_location
+        self.rng = np.random.default_rng(seed)
+        self.items = self.make_items()
+        self.employees = self.make_employees()
+        self.next_check_id = 10 ** 9
+        self.next_confirmation_id = 1
+
+    def make_items(self):
+        rows = []
+        for major, family, n, (low, high) in FAMILIES:
+            for i in range(n):
+                name = f"{family} {i + 1}".upper()
+                if family == "Menu":
+                    name = f"MENU GUIDA {i + 1}"
+                rows.append({
+                    "menuItemID": 100000 + len(rows),
+                    "menuItemName": name,
+                    "menuItemMasterName": name,
+                    "majorGroupName": major,
+                    "familyGroupName": family.upper(),
+                    "price": round(self.rng.uniform(low, high), 1),
+                })
+
+        return pd.DataFrame(rows)
+
+    def make_employees(self, per_location=25):
+        n = len(self.locations) * per_location
+
+        return pd.DataFrame({
+            "locationID": np.repeat(self.locations, per_location),
+            "employeeID": np.repeat(self.locations, per_location) * 1000 + np.tile(np.arange(per_location), len(self.locations)),
+            "employeeFirstName": self.rng.choice(FIRST_NAMES, n),
+            "employeeLastName": self.rng.choice(np.array(LAST_NAMES, dtype=object), n),
+        })
+
+    def _employees_of(self, location_ids):
+
+        # random employee of each row's location
+        per_location = self.employees.groupby("locationID").size().iloc[0]
+        positions = (location_ids - 1) * per_location + self.rng.integers(0, per_location, len(location_ids))
+
+        return self.employees.iloc[positions].reset_index(drop=True)
+
+    def oracle_employees(self, date):
+        n = len(self.locations) * self.rows_per_location
+        location_ids = np.repeat(self.locations, self.rows_per_location)
+        employees = self._employees_of(location_ids)
+        items = self.items.iloc[self.rng.integers(0, len(self.items), n)].reset_index(drop=True)
+        counts = self.rng.integers(1, 7, n)
+        gross = counts * items["price"].to_numpy()
+        discount = np.where(self.rng.random(n) < 0.05, np.round(gross * 0.1, 2), 0)
+
+        return pd.DataFrame({
+            "businessDate": f"{date:%Y-%m-%d}",
+            "locationID": location_ids,
+            "revenueCenterID": location_ids * 10 + 1,
+            "employeeID": employees["employeeID"],
+            "menuItemID": items["menuItemID"],
+            "revenueCenterName": [f"RISTORANTE {i}" for i in location_ids],
+            "employeeFirstName": employees["employeeFirstName"],
+            "employeeLastName": employees["employeeLastName"],
+            "menuItemName": items["menuItemName"],
+            "menuItemMasterName": items["menuItemMasterName"],
+            "majorGroupName": items["majorGroupName"],
+            "familyGroupName": items["familyGroupName"],
+            "salesTotal": np.round(gross - discount, 2),
+            "salesCount": counts,
+            "grossSalesBeforeDiscount": np.round(gross, 2),
+            "discountTotal": discount,
+        })
+
+    def oracle_guests(self, date):
+        n = len(self.locations) * self.checks_per_location
+        location_ids = np.repeat(self.locations, self.checks_per_location)
+        employees = self._employees_of(location_ids)
+        check_ids = np.arange(self.next_check_id, self.next_check_id + n)
+        self.next_check_id += n
+
+        # lunch and dinner services, some dinners closing after midnight
+        lunch = self.rng.random(n) < 0.4
+        open_minutes = np.where(lunch, self.rng.integers(12 * 60, 14 * 60, n), self.rng.integers(19 * 60, 22 * 60, n))
+        duration = self.rng.integers(30 * 60, 150 * 60, n)
+        opened = pd.Timestamp(date) + pd.to_timedelta(open_minutes, unit="m")
+        closed = opened + pd.to_timedelta(duration, unit="s")
+        guests = self.rng.integers(1, 9, n)
+        sub_total = np.round(guests * self.rng.uniform(25, 70, n), 2)
+        discount = np.where(self.rng.random(n) < 0.05, np.round(sub_total * 0.1, 2), 0)
+
+        return pd.DataFrame({
+            "openBusinessDate": f"{date:%Y-%m-%d}",
+            "closeDateTime": closed.strftime("%Y-%m-%dT%H:%M:%S"),
+            "openDateTime": opened.strftime("%Y-%m-%dT%H:%M:%S"),
+            "guestCheckID": check_ids,
+            "employeeID": employees["employeeID"],
+            "revenueCenterID": location_ids * 10 + 1,
+            "locationID": location_ids,
+            "orderTypeID": 1,
+            "numGuests": guests,
+            "checkTotal": np.round(sub_total - discount, 2),
+            "voidTotal": 0,
+            "tipTotal": np.round(np.where(self.rng.random(n) < 0.2, sub_total * 0.05, 0), 2),
+            "errorCorrectTotal": 0,
+            "transferToCheckNum": 0,
+            "serviceChargeTotal": 0,
+            "discountTotal": discount,
+            "subTotal": sub_total,
+            "checkDuration": duration,
+            "numItems": guests * self.rng.integers(2, 5, n),
+            "errorCorrectCount": 0,
+            "isEmployeeMealFlag": (self.rng.random(n) < 0.02).astype(int),
+            "transferStatusCode": "N",
+            "transferStatus": "NONE",
+            "orderTypeName": "Dine In",
+            "employeeFirstName": employees["employeeFirstName"],
+            "employeeLastName": employees["employeeLastName"],
+            "tableReference": [f"TAVOLO {t}" for t in self.rng.integers(1, 40, n)],
+        })
+
+    def ga_responses(self, date):
+        rows = []
+        channel_rows = []
+        day_sessions = 0
+        day_users = []
+        for channel, sources in GA_CHANNELS.items():
+            channel_sessions = 0
+            channel_users = []
+            for source in sources:
+                sessions = int(self.rng.integers(1, 40 * len(self.locations)))
+                users = int(self.rng.integers(1, sessions + 1))
+                rows.append({
+                    "dimensions": [f"{date:%Y%m%d}", source, channel],
+                    "metrics": [{"values": [str(sessions), str(users)]}],
+                })
+                channel_sessions += sessions
+                channel_users.append(users)
+
+            # a user of two sources is counted once in the channel
+            users = int(self.rng.integers(max(channel_users), sum(channel_users) + 1))
+            channel_rows.append({
+                "dimensions": [f"{date:%Y%m%d}", channel],
+                "metrics": [{"values": [str(channel_sessions), str(users)]}],
+            })
+            day_sessions += channel_sessions
+            day_users.append(users)
+
+        users = int(self.rng.integers(max(day_users), sum(day_users) + 1))
+        daily_rows = [{
+            "dimensions": [f"{date:%Y%m%d}"],
+            "metrics": [{"values": [str(day_sessions), str(users)]}],
+        }]
+
+        # shaped as Reporting API V4 batchGet responses, one per report of ga_api
+        return {
+            "sources": self._ga_response(["ga:date", "ga:source", "ga:channelGrouping"], rows),
+            Storage.bronze_ga_channels: self._ga_response(["ga:date", "ga:channelGrouping"], channel_rows),
+            Storage.bronze_ga_daily: self._ga_response(["ga:date"], daily_rows),
+        }
+
+    @staticmethod
+    def _ga_response(dimensions, rows):
+        return {
+            "reports": [{
+                "columnHeader": {
+                    "dimensions": dimensions,
+                    "metricHeader": {"metricHeaderEntries": [
+                        {"name": "ga:sessions", "type": "INTEGER"},
+                        {"name": "ga:users", "type": "INTEGER"},
+                    ]},
+                },
+                "data": {"rows": rows},
+            }]
+        }
+
+    def sevenrooms(self, reservation_dates):
+        reservation_dates = pd.DatetimeIndex(reservation_dates)
+        n = len(reservation_dates) * len(self.locations) * self.reservations_per_location
+        dates = np.repeat(reservation_dates, len(self.locations) * self.reservations_per_location)
+        confirmation_ids = np.arange(self.next_confirmation_id, self.next_confirmation_id + n)
+        self.next_confirmation_id += n
+
+        lunch = self.rng.random(n) < 0.4
+        created = dates - pd.to_timedelta(self.rng.integers(0, 30, n), unit="D")
+        updated = created + pd.to_timedelta(self.rng.integers(0, 24 * 60, n), unit="m")
+        reservation_time = np.where(
+            lunch,
+            pd.Series(self.rng.choice(["12:30", "13:00", "13:30"], n)),
+            pd.Series(self.rng.choice(["19:30", "20:00", "20:30", "21:00"], n)),
+        )
+
+        return pd.DataFrame({
+            "Shift Name": np.where(lunch, "LUNCH", "DINNER"),
+            "Created Date": created.strftime("%Y-%m-%d"),
+            "Created Time": created.strftime("%H:%M"),
+            "Reservation Date": dates.strftime("%Y-%m-%d"),
+            "Reservation Time": reservation_time,
+            "Updated - Local Date": updated.strftime("%Y-%m-%d"),
+            "Updated - Local Time": updated.strftime("%H:%M"),
+            "Reservation Status": self.rng.choice(RESERVATION_STATUSES, n, p=[0.2, 0.65, 0.1, 0.05]),
+            "Detailed Status": "seated",
+            "Confirmation #": [f"SR{c:010d}" for c in confirmation_ids],
+            "Booked By": self.rng.choice(["online", "phone", "walk in"], n),
+            "Reservation Notes": self.rng.choice(np.array(NOTES, dtype=object), n),
+            "Booked Covers": self.rng.integers(1, 9, n),
+            "Reservation Tag Categories + Names": self.rng.choice(np.array(RESERVATION_TAGS, dtype=object), n),
+            "Client Notes": self.rng.choice(np.array(NOTES, dtype=object), n),
+        })
+
+    def item_cost(self):
+        df = self.items.rename(columns={
+            "menuItemID": Fields.ora_menu_item_id,
+            "familyGroupName": Fields.ora_family_group_name,
+            "menuItemName": Fields.ora_menu_item_name,
+        })
+        df[Fields.menu_item_cost] = np.round(df["price"] * self.rng.uniform(0.2, 0.4, len(df)), 2)
+
+        return df[[Fields.ora_menu_item_id, Fields.menu_item_cost, Fields.ora_family_group_name,
+                   Fields.ora_menu_item_name]]
+
+    def employee_hours(self):
+        dfs = []
+        for period in ["Pranzo", "Cena"]:
+            df = self.employees.rename(columns={
+                "employeeID": Fields.ora_employee_id,
+                "employeeFirstName": Fields.ora_employee_first_name,
+                "employeeLastName": Fields.ora_employee_last_name,
+            }).drop(columns="locationID")
+            df[Fields.period_of_day] = period
+            df[Fields.hours_per_week] = self.rng.choice([0, 10, 20, 30, 40], len(df))
+            dfs.append(df)
+
+        return pd.concat(dfs, ignore_index=True)
+
+
+def _upload_frame(df, container, file_path, **to_kwargs):
+    buffer = io.BytesIO()
+    if file_path.endswith(".xlsx"):
+        df.to_excel(buffer, index=False)
+    else:
+        df.to_csv(buffer, index=False, **to_kwargs)
+    get_session().upload(container, file_path, buffer.getvalue())
+
+
+def write_uploads(data):
+
+    # manually maintained files
+    _upload_frame(data.item_cost(), Storage.bronze, Storage.item_cost)
+    _upload_frame(data.employee_hours(), Storage.bronze, Storage.employee_hours)
+
+
+def write_oracle_staging(data, date):
+    _upload_frame(data.oracle_employees(date), Storage.staging, f"{Storage.staging_oracle_employees}_{date:%Y%m%d}.csv", sep=";")
+    _upload_frame(data.oracle_guests(date), Storage.staging, f"{Storage.staging_oracle_guests}_{date:%Y%m%d}.csv", sep=";")
+
+
+def write_sevenrooms_staging(data, date):
+
+    # attachments are stored as parquet, as done by sevenrooms.py
+    df = pd.read_csv(io.BytesIO(data.sevenrooms([date]).to_csv(index=False).encode()))
+    write_parquet(df, Storage.staging, f"{Storage.yesterday_reservations}seven_rooms_yesterday_{date:%Y%m%d}.parquet")
+
+
+def write_sevenrooms_future(data, date, days=60):
+    future_dates = pd.date_range(pd.Timestamp(date) + pd.Timedelta(days=1), periods=days)
+    df = pd.read_csv(io.BytesIO(data.sevenrooms(future_dates).to_csv(index=False).encode()))
+    write_parquet(df, Storage.staging, f"{Storage.future_reservations}seven_rooms_future.parquet")
@@ -0,0 +1,202 @@
+import argparse
+import datetime
+import importlib
+import os
+import shutil
+import time
+import pandas as pd
+from grptavutils.logs import logger
+from grptavutils.metrics import new_run_id, rss_sampler, timed_phases, track_step
+from grptavutils.session import LocalStorageSession, set_session
+from benchmark.generators import (
+    SyntheticData, write_uploads, write_oracle_staging, write_sevenrooms_staging,
+    write_sevenrooms_future,
+)
+
+# module functions timed as phases of each step, in pipeline order
+STEPS = [
+    ("oracle_clean_employees", "oracle.oracle_clean_employees", {
+        "read_staging": ["read_staging"],
+        "trunc_staging": ["trunc_staging"],
+        "flags": ["classify_items", "apply_flags"],
+        "join": ["calc_margin"],
+        "history": ["changed_dates", "rewrite_partitions"],
+        "write": ["write_partitions"],
+        "shards": ["map_shards", "clean_locations"],
+    }),
+    ("oracle_clean_guests", "oracle.oracle_clean_guests", {
+        "read_staging": ["read_staging"],
+        "trunc_staging": ["trunc_staging"],
+        "dedup": ["read_guests_index", "known_ids"],
+        "day_period": ["day_period"],
+        "join": ["calc_productivity"],
+        "write": ["write_partitions"],
+        "shards": ["map_shards", "clean_locations"],
+    }),
+    ("sevenrooms_clean_yesterday", "sevenrooms.sevenrooms_clean_yesterday", {
+        "read_staging": ["read_staging"],
+        "read_bronze": ["read_bronze_keys", "read_bronze"],
+        "trunc_staging": ["trunc_staging"],
+        "write": ["write_partitions"],
+    }),
+    ("sevenrooms_clean_future", "sevenrooms.sevenrooms_clean_future", {
+        "read_staging": ["read_staging"],
+        "write": ["write_parquet"],
+    }),
+    ("forecast", "forecast.forecast", {
+        "read_sales": ["read_sales"],
+        "make_forecast": ["make_forecast"],
+        "write": ["write_parquet"],
+    }),
+    ("silver", "silver.silver", {
+        "read_files": ["read_files"],
+        "combine": ["combine_dates", "combine_employees", "combine_items"],
+        "write": ["write_parquet"],
+    }),
+]
+
+
+def run_steps(scenario):
+
+    run_id = new_run_id()
+    records = []
+    for step, module_name, phases in STEPS:
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            logger.warning(f"Skipping benchmark of {step}: {e}")
+            continue
+
+        # shard workers time the same functions and send their phases back
+        with timed_phases({module_name: phases}):
+            try:
+                with track_step(run_id, step) as metrics:
+                    importlib.import_module(module_name).main()
+            except Exception:
+                logger.exception(f"Benchmark of {step} failed")
+                continue
+
+        for phase, record in metrics.phases.items():
+            records.append({**scenario, "step": step, "phase": phase, **record})
+        records.append({
+            **scenario,
+            "step": step,
+            "phase": "total",
+            "calls": 1,
+            "seconds": metrics.wall_seconds,
+            "rows": metrics.rows_out,
+            "peak_rss_bytes": max(metrics.peak_rss_bytes, metrics.worker_peak_rss_bytes),
+            "bytes_read": metrics.bytes_read,
+            "bytes_written": metrics.bytes_written,
+        })
+
+    return records
+
+
+def new_ga_records():
+    return {p: {"calls": 0, "seconds": 0.0, "rows": 0, "peak_rss_bytes": 0} for p in ["make_dataframe", "write"]}
+
+
+def timed_ga_phase(ga_records, phase, fn, *args):
+    window = rss_sampler().open()
+    start = time.perf_counter()
+    result = fn(*args)
+    record = ga_records[phase]
+    record["seconds"] += time.perf_counter() - start
+    record["peak_rss_bytes"] = max(record["peak_rss_bytes"], rss_sampler().close(window))
+    record["calls"] += 1
+
+    return result
+
+
+def write_staging(data, dates, ga_records):
+
+    # ga_api phases are timed here, on a synthetic API response
+    from googleanalytics.ga_api import SOURCES, make_dataframes, write_bronze
+
+    for d in dates:
+        write_oracle_staging(data, d)
+        write_sevenrooms_staging(data, d)
+
+        responses = data.ga_responses(d)
+        frames = timed_ga_phase(ga_records, "make_dataframe", make_dataframes, responses)
+        timed_ga_phase(ga_records, "write", write_bronze, frames)
+        ga_records["make_dataframe"]["rows"] += frames[SOURCES].shape[0]
+        ga_records["write"]["rows"] += frames[SOURCES].shape[0]
+
+
+def run_scenario(root, restaurants, years, daily_days, rows_per_location, checks_per_location, seed):
+
+    # start from empty containers
+    scenario_root = os.path.join(root, f"restaurants_{restaurants}_years_{years}")
+    shutil.rmtree(scenario_root, ignore_errors=True)
+    set_session(LocalStorageSession(scenario_root))
+
+    scenario = {"restaurants": restaurants, "years": years}
+    data = SyntheticData(
+        restaurants, rows_per_location=rows_per_location, checks_per_location=checks_per_location, seed=seed
+    )
+    yesterday = pd.Timestamp(datetime.date.today() - datetime.timedelta(days=1))
+    dates = pd.date_range(end=yesterday, periods=years * 365)
+    write_uploads(data)
+
+    # load history untimed, then time the last days only
+    if daily_days > 0:
+        logger.info(f"Loading {len(dates) - daily_days} days of history")
+        write_staging(data, dates[:-daily_days], new_ga_records())
+        write_sevenrooms_future(data, dates[-daily_days - 1])
+        run_steps(scenario)
+        dates = dates[-daily_days:]
+
+    ga_records = new_ga_records()
+    logger.info(f"Generating {len(dates)} days for {restaurants} restaurants")
+    start = time.perf_counter()
+    write_staging(data, dates, ga_records)
+    write_sevenrooms_future(data, dates[-1])
+    logger.info(f"Generated staging files in {time.perf_counter() - start:.1f}s")
+
+    records = [{**scenario, "step": "ga_api", "phase": p, **r} for p, r in ga_records.items()]
+    records += run_steps(scenario)
+
+    return records
+
+
+def report(records):
+    df = pd.DataFrame(records)
+    df["rows_per_second"] = (df["rows"] / df["seconds"]).round(0)
+    df["peak_rss_mb"] = (df["peak_rss_bytes"] / 1024 ** 2).round(1)
+    df["seconds"] = df["seconds"].round(3)
+
+    return df.drop(columns="peak_rss_bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data stored on local disk")
+    parser.add_argument("--restaurants", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--years", type=int, nargs="+", default=[1])
+    parser.add_argument("--daily-days", type=int, default=0,
+                        help="time only the last days, loading the rest of the history untimed first")
+    parser.add_argument("--rows-per-location", type=int, default=250, help="rows of a daily Employee export")
+    parser.add_argument("--checks-per-location", type=int, default=120, help="rows of a daily Guest export")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--root", default="/tmp/grptav_benchmark", help="local directory standing in for storage")
+    parser.add_argument("--output", default=None, help="csv file to save the results to")
+    args = parser.parse_args()
+
+    records = []
+    for restaurants in args.restaurants:
+        for years in args.years:
+            records += run_scenario(
+                args.root, restaurants, years, args.daily_days, args.rows_per_location,
+                args.checks_per_location, args.seed,
+            )
+
+    df = report(records)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(df.to_string(index=False))
+    if args.output is not None:
+        df.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
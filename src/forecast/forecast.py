@@ -1,12 +1,20 @@
 import datetime
 import pandas as pd
 from grptavutils.constants import Fields, Storage
-from grptavutils import read_parquet, write_parquet
+from grptavutils import write_parquet
+from grptavutils.partitions import read_dataset
 from prophet import Prophet
 
+START_DATE = datetime.datetime(2022, 9, 1, 0, 0)
+
 
 def read_sales():
-    df = read_parquet(container=Storage.bronze, file_path=Storage.bronze_oracle_employees)
+    df = read_dataset(
+        container=Storage.bronze,
+        dataset_path=Storage.bronze_oracle_employees,
+        columns=[Fields.date, Fields.ora_sales_total],
+        start_date=START_DATE,
+    )
     df = (
         df
         .groupby([Fields.date], as_index=False)
@@ -27,7 +35,7 @@ def make_forecast(df_in: pd.DataFrame):
     df_in.rename(columns=renaming_dict, inplace=True)
 
     # trunc to relevant dates
-    mask = df_in["ds"] >= datetime.datetime(2022, 9, 1, 0, 0)
+    mask = df_in["ds"] >= START_DATE
     df = df_in[mask].copy()
 
     # resample
@@ -1,26 +1,148 @@
 """Based on Google Analytics Reporting API V4."""
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+import httplib2
 from oauth2client.service_account import ServiceAccountCredentials
+import numpy as np
 import pandas as pd
-import os
-import json
-from grptavutils import Storage
+from grptavutils import Storage, read_parquet, write_csv, write_json, write_parquet
+from grptavutils.constants import Fields
 from grptavutils.logs import logger
+from grptavutils.metrics import bind
+from grptavutils.partitions import list_partition_dates, migrate_to_partitions, write_partitions
+from grptavutils.ratelimit import TokenBucket, call_with_retries
+from grptavutils.schemas import Schemas
+from googleanalytics.ga_clean import ROLLUPS, clean_report, update_rollups
 import datetime
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 SCOPES = ["https://www.googleapis.com/auth/analytics.readonly"]
 KEY_FILE_LOCATION = "../../secrets/gruppotavola-47872-de387bc63f40.json"
 VIEW_ID = "274858544"
 
+# largest page the API returns, days per request and concurrent requests per view
+PAGE_SIZE = 100000
+BATCH_DAYS = 31
+MAX_REQUESTS = 4
+
+# Reporting API quotas of a view, requests are spread to stay below them
+REQUESTS_PER_100_SECONDS = 1800
+REQUESTS_PER_DAY = 10000
+
+# rate limited and transient errors are retried with backoff
+MAX_ATTEMPTS = 6
+RETRY_STATUSES = {429, 500, 503}
+RETRY_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded", "backendError", "internalError"}
+
+# dimensions of the reports read per batch. GA counts a user once per row, the
+# users of a channel or a day come from reports at that level, not from sums
+SOURCES = "sources"
+REPORTS = {
+    SOURCES: ["ga:date", "ga:source", "ga:channelGrouping"],
+    Storage.bronze_ga_channels: ["ga:date", "ga:channelGrouping"],
+    Storage.bronze_ga_daily: ["ga:date"],
+}
+
+_local = threading.local()
+_quotas = {}
+_quotas_lock = threading.Lock()
+
+
+class QuotaExhausted(Exception):
+    pass
+
+
+def read_quota_usage():
+    try:
+        return read_parquet(Storage.bronze, Storage.bronze_ga_quota)
+
+    except FileNotFoundError:
+        return pd.DataFrame(columns=[Fields.ga_view_id, Fields.date, Fields.ga_requests])
+
+
+def add_quota_usage(view_id, day, requests):
+
+    # requests of the day by every run, the daily job, backfills and retries alike
+    df = read_quota_usage()
+    day = pd.Timestamp(day)
+    mask = (df[Fields.ga_view_id] == view_id) & (df[Fields.date] == day)
+    total = int(df.loc[mask, Fields.ga_requests].sum()) + requests
+    if requests > 0:
+        usage_df = pd.DataFrame({Fields.ga_view_id: [view_id], Fields.date: [day], Fields.ga_requests: [total]})
+        df = pd.concat([df[~mask & (df[Fields.date] >= day)], usage_df], ignore_index=True)
+        write_parquet(dataframe=df, container=Storage.bronze, file_path=Storage.bronze_ga_quota)
+
+    return total
+
+
+class ViewQuota:
+    """Client-side accounting of the Reporting API quota of a view.
+
+    The requests of the day are kept in bronze, save() adds the ones made since
+    the last save and reads back those of other runs.
+    """
+
+    def __init__(self, view_id):
+        self.view_id = view_id
+        self.bucket = TokenBucket(REQUESTS_PER_100_SECONDS / 100, MAX_REQUESTS)
+        self.day = datetime.date.today()
+        self.requests_today = add_quota_usage(view_id, self.day, 0)
+        self.requests = 0
+        self.retries = 0
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+
+        # the daily quota is not worth waiting for, the next run resumes
+        with self._lock:
+            today = datetime.date.today()
+            if self.day != today:
+                self.day = today
+                self.requests_today = add_quota_usage(self.view_id, today, 0)
+                self._unsaved = 0
+            if self.requests_today >= REQUESTS_PER_DAY:
+                raise QuotaExhausted(f"Daily quota of view {self.view_id} exhausted")
+            self.requests_today += 1
+            self.requests += 1
+            self._unsaved += 1
+
+        self.bucket.acquire()
+
+    def save(self):
+        with self._lock:
+            self.requests_today = add_quota_usage(self.view_id, self.day, self._unsaved)
+            self._unsaved = 0
 
-def initialize_analyticsreporting():
+    def retried(self, error, delay):
+        with self._lock:
+            self.retries += 1
+        logger.warning(f"GA request for view {self.view_id} failed ({error}), retrying in {delay:.1f}s")
+
+
+def view_quota(view_id):
+    with _quotas_lock:
+        if view_id not in _quotas:
+            _quotas[view_id] = ViewQuota(view_id)
+
+        return _quotas[view_id]
+
+
+def read_credentials():
+    return ServiceAccountCredentials.from_json_keyfile_name(KEY_FILE_LOCATION, SCOPES)
+
+
+def initialize_analyticsreporting(credentials=None):
     """Initializes an Analytics Reporting API V4 service object.
 
   Returns:
     An authorized Analytics Reporting API V4 service object.
   """
-    credentials = ServiceAccountCredentials.from_json_keyfile_name(
-        KEY_FILE_LOCATION, SCOPES)
+    if credentials is None:
+        credentials = read_credentials()
 
     # Build the service object.
     analytics = build("analyticsreporting", "v4", credentials=credentials)
@@ -28,31 +150,258 @@ def initialize_analyticsreporting():
     return analytics
 
 
-def get_report(analytics, date_string):
+def thread_http(credentials):
+
+    # httplib2 connections are not thread safe, one authorised connection per thread
+    if getattr(_local, "http", None) is None:
+        _local.http = credentials.authorize(httplib2.Http())
+
+    return _local.http
+
+
+def get_report(analytics, date_string, end_date_string=None, page_token=None, http=None, dimensions=None):
     """Queries the Analytics Reporting API V4.
 
   Args:
     :param analytics: An authorized Analytics Reporting API V4 service object.
     :param date_string: date in the format "yyyy-mm-dd", accepts also "yesterday"
+    :param end_date_string: last date of the range, date_string when not given
+    :param page_token: nextPageToken of the previous page
+    :param http: authorised connection, the service's own when not given
+    :param dimensions: dimensions of the report, those of the sources report when not given
   Returns:
     The Analytics Reporting API V4 response.
   """
-    return analytics.reports().batchGet(
-        body={
-            "reportRequests": [
-                {
-                    "viewId": VIEW_ID,
-                    "dateRanges": [{"startDate": date_string, "endDate": date_string}],
-                    "metrics": [
-                        {"expression": "ga:sessions"},
-                        {"expression": "ga:users"},
-                    ],
-                    "dimensions": [
-                        {"name": "ga:date"},
-                        {"name": "ga:source"},
-                        {"name": "ga:channelGrouping"},
-                    ]
-                }]}).execute()
+    if end_date_string is None:
+        end_date_string = date_string
+    if dimensions is None:
+        dimensions = REPORTS[SOURCES]
+
+    request = {
+        "viewId": VIEW_ID,
+        "dateRanges": [{"startDate": date_string, "endDate": end_date_string}],
+        "metrics": [
+            {"expression": "ga:sessions"},
+            {"expression": "ga:users"},
+        ],
+        "dimensions": [{"name": name} for name in dimensions],
+        "pageSize": PAGE_SIZE,
+    }
+    if page_token is not None:
+        request["pageToken"] = page_token
+
+    return analytics.reports().batchGet(body={"reportRequests": [request]}).execute(http=http)
+
+
+def error_reason(error):
+    try:
+        return json.loads(error.content.decode("utf-8"))["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return ""
+
+
+def is_retryable(error):
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+
+    return status in RETRY_STATUSES or (status == 403 and error_reason(error) in RETRY_REASONS)
+
+
+def request_page(analytics, date_string, end_date_string=None, page_token=None, http=None, dimensions=None):
+
+    # every attempt takes a token of the view, rate limits are retried with backoff
+    quota = view_quota(VIEW_ID)
+
+    def request():
+        quota.acquire()
+        try:
+            return get_report(analytics, date_string, end_date_string, page_token=page_token, http=http, dimensions=dimensions)
+        except HttpError as e:
+            if error_reason(e) == "dailyLimitExceeded":
+                raise QuotaExhausted(f"Daily quota of view {VIEW_ID} exhausted") from e
+            raise
+
+    return call_with_retries(request, is_retryable, MAX_ATTEMPTS, on_retry=quota.retried)
+
+
+def get_all_pages(analytics, date_string, end_date_string=None, http=None, dimensions=None):
+
+    # follow nextPageToken of the page just read, a page stops at PAGE_SIZE rows
+    reports = []
+    page_token = None
+    while True:
+        response = request_page(
+            analytics, date_string, end_date_string, page_token=page_token, http=http, dimensions=dimensions
+        )
+        page_reports = response.get("reports", [])
+        reports += page_reports
+        page_token = page_reports[-1].get("nextPageToken") if len(page_reports) > 0 else None
+        if page_token is None:
+            break
+
+    return {"reports": reports}
+
+
+def date_batches(dates, days=BATCH_DAYS):
+
+    # runs of consecutive dates, in ranges of at most days days told apart by ga:date
+    dates = pd.DatetimeIndex(sorted(dates))
+    runs = np.split(dates, np.flatnonzero(np.diff(dates.asi8) != pd.Timedelta(days=1).value) + 1)
+    batches = []
+    for run in runs:
+        for i in range(0, len(run), days):
+            batch = run[i:i + days]
+            batches.append((f"{batch[0]:%Y-%m-%d}", f"{batch[-1]:%Y-%m-%d}"))
+
+    return batches
+
+
+def read_checkpoint():
+    try:
+        return read_parquet(Storage.bronze, Storage.bronze_ga_checkpoint)
+
+    except FileNotFoundError:
+        return pd.DataFrame(columns=[Fields.ga_view_id, Fields.date, Fields.row_count, Fields.processed_time])
+
+
+def update_checkpoint(checkpoint_df, batch, row_counts):
+
+    # every day of the batch is done, including days without sessions
+    dates = pd.date_range(start=batch[0], end=batch[1])
+    done_df = pd.DataFrame({
+        Fields.ga_view_id: VIEW_ID,
+        Fields.date: dates,
+        Fields.row_count: row_counts.reindex(dates).fillna(0).astype("int64").to_numpy(),
+        Fields.processed_time: datetime.datetime.now(),
+    })
+
+    mask = (checkpoint_df[Fields.ga_view_id] == VIEW_ID) & checkpoint_df[Fields.date].isin(dates)
+    df = pd.concat([checkpoint_df[~mask], done_df], ignore_index=True)
+    write_parquet(dataframe=df, container=Storage.bronze, file_path=Storage.bronze_ga_checkpoint)
+
+    return df
+
+
+def extract(start_date, end_date, resume=True, to_bronze=True):
+    """Reads sessions and users of every day from start_date to end_date.
+
+    Days go straight to the partitioned bronze dataset, or to one staging file
+    per day for ga_clean. The range is split in multi-day batches queried
+    concurrently, at most MAX_REQUESTS at a time within the quota of the view.
+    Finished days are kept in a checkpoint, with resume only the days missing
+    from it are read.
+    """
+
+    checkpoint_df = read_checkpoint()
+    dates = pd.date_range(start=start_date, end=end_date)
+    if resume:
+        done = checkpoint_df.loc[checkpoint_df[Fields.ga_view_id] == VIEW_ID, Fields.date]
+        dates = dates.difference(pd.DatetimeIndex(done))
+    if len(dates) == 0:
+        logger.info(f"Nothing to read from {start_date} to {end_date}")
+        return
+
+    if to_bronze:
+        migrate_to_partitions(Storage.bronze, Storage.legacy_bronze_ga, Storage.bronze_ga, schema=Schemas.ga)
+    archive = os.environ.get(Storage.ga_archive_env, "") not in ("", "0")
+
+    credentials = read_credentials()
+    analytics = initialize_analyticsreporting(credentials)
+
+    def get_batch(batch):
+        responses = {}
+        for name, dimensions in REPORTS.items():
+            http = thread_http(credentials)
+            responses[name] = get_all_pages(analytics, batch[0], batch[1], http=http, dimensions=dimensions)
+            if archive:
+                archive_response(batch, name, responses[name])
+        logger.info(f"Read {batch[0]} to {batch[1]}")
+        return make_dataframes(responses)
+
+    quota = view_quota(VIEW_ID)
+
+    # requests are counted in bronze even when a batch fails
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_REQUESTS) as executor:
+            futures = {executor.submit(bind(get_batch), b): b for b in date_batches(dates)}
+            try:
+                for f in as_completed(futures):
+                    frames = f.result()
+                    df = frames[SOURCES]
+                    if to_bronze:
+                        write_bronze(frames)
+                    else:
+                        write_days(df)
+                    row_counts = df.groupby(pd.to_datetime(df["date"], format="%Y%m%d")).size()
+                    checkpoint_df = update_checkpoint(checkpoint_df, futures[f], row_counts)
+                    quota.save()
+            except Exception as e:
+                # batches not started are left to the next run
+                for f in futures:
+                    f.cancel()
+                if not isinstance(e, QuotaExhausted):
+                    raise
+                logger.warning(f"{e}, the next run resumes from the checkpoint")
+    finally:
+        quota.save()
+
+    logger.info(f"GA view {VIEW_ID}: {quota.requests} requests, {quota.retries} retries, {quota.requests_today} today")
+
+
+# column names of the dataframe, as read by ga_clean
+COLUMNS = {
+    "ga:date": "date",
+    "ga:source": "source",
+    "ga:channelGrouping": "channelGrouping",
+    "ga:sessions": "sessions",
+    "ga:users": "users",
+}
+
+# position of the date range of a row, requests of extract carry a single range
+DATE_RANGE = "dateRange"
+
+# metric values are typed at parse time, other metric types are kept as strings
+METRIC_TYPES = {
+    "INTEGER": np.int64,
+    "FLOAT": np.float64,
+    "CURRENCY": np.float64,
+    "PERCENT": np.float64,
+    "TIME": np.float64,
+}
+
+
+def parse_report(report):
+
+    column_header = report.get("columnHeader", {})
+    dimension_headers = column_header.get("dimensions", [])
+    metric_headers = column_header.get("metricHeader", {}).get("metricHeaderEntries", [])
+
+    # one list per column, filled in a single pass over the rows. A row holds the
+    # metrics of every date range of the request, each becomes a row of its own
+    # with the position of its range in dateRange
+    dimensions = [[] for _ in dimension_headers]
+    metrics = [[] for _ in metric_headers]
+    date_ranges = []
+    for row in report.get("data", {}).get("rows", []):
+        for i, date_range in enumerate(row.get("metrics", [])):
+            for values, value in zip(dimensions, row.get("dimensions", [])):
+                values.append(value)
+            for values, value in zip(metrics, date_range.get("values", [])):
+                values.append(value)
+            date_ranges.append(i)
+
+    columns = {}
+    for header, values in zip(dimension_headers, dimensions):
+        columns[header] = values
+    columns[DATE_RANGE] = np.array(date_ranges, dtype=np.int64)
+    for header, values in zip(metric_headers, metrics):
+        dtype = METRIC_TYPES.get(header.get("type"))
+        if dtype is not None:
+            values = np.array(values, dtype=str).astype(dtype)
+        columns[header.get("name", "")] = values
+
+    return pd.DataFrame(columns)
 
 
 def make_dataframe(response):
@@ -60,84 +409,67 @@ def make_dataframe(response):
     Parses Analytics Reporting API V4 response and make a pandas dataframe
 
     Args:
-        response: A pandas dataframe.
+        response: A batchGet response, with one or more reports.
     """
 
-    df_columns = []
-
-    # parse dimensions
-    for report in response.get("reports", []):
-        column_header = report.get("columnHeader", {})
-        dimension_headers = column_header.get("dimensions", [])
-        for dim in dimension_headers:
-            df_columns.append(dim)
-
-    # parse metrics
-    for report in response.get("reports", []):
-        column_header = report.get("columnHeader", {})
-        metric_headers = column_header.get("metricHeader", [])
-        metric_header_entries = metric_headers.get("metricHeaderEntries", [])
-        for metric in metric_header_entries:
-            df_columns.append(metric.get("name", ""))
-
-    # empty dataframe
-    df = pd.DataFrame(columns=df_columns)
-
-    # iterate on data
-    for report in response.get("reports", []):
-        for row in report.get("data", {}).get("rows", []):
-            current_row = []
-            for dim in row.get("dimensions", ""):
-                current_row.append(dim)
-            for metric in row.get("metrics", []):
-                for val in metric.get("values", ""):
-                    current_row.append(val)
-            df.loc[len(df)] = current_row
+    dfs = [parse_report(report) for report in response.get("reports", [])]
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=list(COLUMNS.values()) + [DATE_RANGE])
+
+    df = pd.concat(dfs, ignore_index=True)
 
     # rename columns
-    df = df.rename(columns={
-        "ga:date": "date",
-        "ga:source": "source",
-        "ga:channelGrouping": "channelGrouping",
-        "ga:sessions": "sessions",
-        "ga:users": "users",
-    })
+    df = df.rename(columns=COLUMNS)
 
     return df
 
 
-def write_data(df_in):
-    logger.info("Writing to azure...")
+def make_dataframes(responses):
+    return {name: make_dataframe(response) for name, response in responses.items()}
 
-    # get azure access credentials
-    with open("../../secrets/azure_creds.json", "r") as f:
-        storage_options = json.load(f)
+
+def write_data(df_in):
+    logger.info("Writing to storage...")
 
     # file details
     datestr = df_in["date"].iloc[0]
     filename = f"googleanalytics_{datestr}.csv"
-    file_path = os.path.join("googleanalytics", filename)
-    container = Storage.staging
-    account_name = Storage.account_name
+    file_path = f"{Storage.staging_ga}{filename}"
 
-    df_in.to_csv(
-        f"abfs://{container}@{account_name}.dfs.core.windows.net/{file_path}",
-        index=False,
-        storage_options=storage_options
-    )
+    write_csv(dataframe=df_in, container=Storage.staging, file_path=file_path)
 
     logger.info(f"Done! Saved file {file_path}")
 
 
-def main():
-    analytics = initialize_analyticsreporting()
+def write_days(df_in):
+
+    # one staging file per day, as ga_clean expects
+    for _, df in df_in.groupby("date", sort=True):
+        write_data(df.reset_index(drop=True))
+
+
+def write_bronze(frames):
 
+    # typed rows straight to bronze, a day read again replaces its partition
+    df = clean_report(frames[SOURCES])
+    write_partitions(dataframe=df, container=Storage.bronze, dataset_path=Storage.bronze_ga, schema=Schemas.ga)
+
+    # rollups take the users of their own reports
+    exact = {file_path: clean_report(frames[file_path]) for file_path, _, _ in ROLLUPS if file_path in frames}
+    update_rollups(df, list_partition_dates(Storage.bronze, Storage.bronze_ga), exact=exact)
+
+
+def archive_response(batch, name, response):
+    report = "" if name == SOURCES else f"{os.path.splitext(os.path.basename(name))[0]}_"
+    file_path = f"{Storage.staging_ga_raw}googleanalytics_{report}{batch[0]}_{batch[1]}.json"
+    write_json(response, container=Storage.staging, file_path=file_path)
+
+
+def main():
     yesterday = datetime.date.today() - datetime.timedelta(days=1)
-    date_string = yesterday.strftime("%Y-%m-%d")
 
-    response = get_report(analytics, date_string=date_string)
-    df = make_dataframe(response)
-    write_data(df)
+    # yesterday is read again even when already in the checkpoint
+    extract(yesterday, yesterday, resume=False)
 
 
 if __name__ == "__main__":
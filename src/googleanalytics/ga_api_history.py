@@ -1,153 +1,15 @@
-"""Based on Google Analytics Reporting API V4."""
-from googleapiclient.discovery import build
-from oauth2client.service_account import ServiceAccountCredentials
-import pandas as pd
-import os
-import json
+"""Backfill of the Google Analytics bronze dataset, based on Google Analytics Reporting API V4."""
 import datetime
-from grptavutils.constants import Storage
 from grptavutils.logs import logger
+from googleanalytics.ga_api import extract
 
-SCOPES = ["https://www.googleapis.com/auth/analytics.readonly"]
-KEY_FILE_LOCATION = "../../secrets/gruppotavola-47872-de387bc63f40.json"
-VIEW_ID = "274858544"
 
+def main(start_date, end_date):
 
-def initialize_analyticsreporting():
-    """Initializes an Analytics Reporting API V4 service object.
-
-  Returns:
-    An authorized Analytics Reporting API V4 service object.
-  """
-    credentials = ServiceAccountCredentials.from_json_keyfile_name(
-        KEY_FILE_LOCATION, SCOPES)
-
-    # Build the service object.
-    analytics = build("analyticsreporting", "v4", credentials=credentials)
-
-    return analytics
-
-
-def get_report(analytics, date_string):
-    """Queries the Analytics Reporting API V4.
-
-  Args:
-    :param analytics: An authorized Analytics Reporting API V4 service object.
-    :param date_string: date in the format "yyyy-mm-dd", accepts also "yesterday"
-  Returns:
-    The Analytics Reporting API V4 response.
-  """
-    return analytics.reports().batchGet(
-        body={
-            "reportRequests": [
-                {
-                    "viewId": VIEW_ID,
-                    "dateRanges": [{"startDate": date_string, "endDate": date_string}],
-                    "metrics": [
-                        {"expression": "ga:sessions"},
-                        {"expression": "ga:users"},
-                    ],
-                    "dimensions": [
-                        {"name": "ga:date"},
-                        {"name": "ga:source"},
-                        {"name": "ga:channelGrouping"},
-                    ]
-                }]}).execute()
-
-
-def make_dataframe(response):
-    """
-    Parses Analytics Reporting API V4 response and make a pandas dataframe
-
-    Args:
-        response: A pandas dataframe.
-    """
-
-    df_columns = []
-
-    # parse dimensions
-    for report in response.get("reports", []):
-        column_header = report.get("columnHeader", {})
-        dimension_headers = column_header.get("dimensions", [])
-        for dim in dimension_headers:
-            df_columns.append(dim)
-
-    # parse metrics
-    for report in response.get("reports", []):
-        column_header = report.get("columnHeader", {})
-        metric_headers = column_header.get("metricHeader", [])
-        metric_header_entries = metric_headers.get("metricHeaderEntries", [])
-        for metric in metric_header_entries:
-            df_columns.append(metric.get("name", ""))
-
-    # empty dataframe
-    df = pd.DataFrame(columns=df_columns)
-
-    # iterate on data
-    for report in response.get("reports", []):
-        for row in report.get("data", {}).get("rows", []):
-            current_row = []
-            for dim in row.get("dimensions", ""):
-                current_row.append(dim)
-            for metric in row.get("metrics", []):
-                for val in metric.get("values", ""):
-                    current_row.append(val)
-            df.loc[len(df)] = current_row
-
-    # rename columns
-    df = df.rename(columns={
-        "ga:date": "date",
-        "ga:source": "source",
-        "ga:channelGrouping": "channelGrouping",
-        "ga:sessions": "sessions",
-        "ga:users": "users",
-    })
-
-    return df
-
-
-def write_data(df_in):
-
-    # get azure access credentials
-    with open("../../secrets/azure_creds.json", "r") as f:
-        storage_options = json.load(f)
-
-    # file details
-    datestr = df_in["date"].iloc[0]
-    filename = f"googleanalytics_{datestr}.csv"
-    file_path = os.path.join("googleanalytics", filename)
-    container = Storage.staging
-    account_name = Storage.account_name
-
-    logger.info(f"Writing {filename} to azure...")
-    df_in.to_csv(
-        f"abfs://{container}@{account_name}.dfs.core.windows.net/{file_path}",
-        index=False,
-        storage_options=storage_options
-    )
-
-    logger.info("Done!")
-
-
-def main(date_string="yesterday"):
-    analytics = initialize_analyticsreporting()
-    response = get_report(analytics, date_string=date_string)
-    df = make_dataframe(response)
-    if df.shape[0] == 0:
-        logger.info(f"Skipping writing for {date_string}")
-    else:
-        logger.info(f"Writing data for {date_string}")
-        write_data(df)
+    # multi-day batches read concurrently, an interrupted backfill resumes from the checkpoint
+    logger.info(f"Backfilling {start_date} to {end_date}")
+    extract(start_date, end_date, resume=True)
 
 
 if __name__ == "__main__":
-    dates = pd.date_range(
-        start=datetime.date(2022, 12, 4),
-        end=datetime.date(2022, 12, 6)
-    )
-
-    dates = list(dates)
-    dates = [x.strftime("%Y-%m-%d") for x in dates]
-
-    for d in dates:
-        main(d)
+    main(datetime.date(2022, 12, 4), datetime.date(2022, 12, 6))
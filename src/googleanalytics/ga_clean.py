@@ -1,99 +1,187 @@
 import pandas as pd
-from grptavutils import list_blob_files, read_parquet, read_csv, write_parquet, delete_staging_files
+from grptavutils import read_parquet, read_staging_files, list_blob_properties, write_parquet
 from grptavutils.constants import Fields, Storage
+from grptavutils.manifest import read_manifest, new_staging_files, update_manifest
+from grptavutils.normalise import normalise
+from grptavutils.partitions import list_partition_dates, migrate_to_partitions, read_dataset, write_partitions
+from grptavutils.schemas import Schemas, cast_frame, concat_frames
 from grptavutils.logs import logger
 
-def read_bronze():
-    try:
-        df = read_parquet(Storage.bronze, Storage.bronze_ga)
-        return df
+# daily rollups kept next to the source level rows, read by silver
+ROLLUPS = [
+    (Storage.bronze_ga_channels, [Fields.date, Fields.ga_channel_grouping], Schemas.ga_channels),
+    (Storage.bronze_ga_daily, [Fields.date], Schemas.ga_daily),
+]
+ROLLUP_COLUMNS = [Fields.date, Fields.ga_channel_grouping, Fields.ga_sessions]
 
-    except FileNotFoundError:
-        empty_df = pd.DataFrame(columns=[
-            Fields.filename,
-            Fields.date,
-            Fields.ga_source,
-            Fields.ga_channel_grouping,
-            Fields.ga_sessions,
-            Fields.ga_users,
-        ])
 
-        return empty_df
+def read_bronze_dates():
+    migrate_to_partitions(Storage.bronze, Storage.legacy_bronze_ga, Storage.bronze_ga, schema=Schemas.ga)
+    dates = list_partition_dates(Storage.bronze, Storage.bronze_ga)
+
+    return dates
+
 
+# columns of the GA report, as written by ga_api
+REN_COLS = {
+    "date": Fields.date,
+    "source": Fields.ga_source,
+    "channelGrouping": Fields.ga_channel_grouping,
+    "sessions": Fields.ga_sessions,
+    "users": Fields.ga_users,
+}
 
-def read_staging():
-    files = list_blob_files(container_name="staging", blob_path="googleanalytics/")
 
-    # iterate over files
-    df = pd.DataFrame()
-    for f in files:
-        current_df = read_csv(container=Storage.staging, file_path=f)
-        current_df.loc[:, Fields.filename] = f
-        df = pd.concat([df, current_df])
+def clean_report(df_in):
+    """Typed bronze rows of a GA report, read from staging or straight from the API."""
 
     # rename columns
-    ren_cols = {
-        Fields.filename: Fields.filename,
-        "date": Fields.date,
-        "source": Fields.ga_source,
-        "channelGrouping": Fields.ga_channel_grouping,
-        "sessions": Fields.ga_sessions,
-        "users": Fields.ga_users,
-    }
-    df = df.rename(columns=ren_cols)
+    df = df_in.rename(columns=REN_COLS)
 
-    # select
-    sel = list(ren_cols.values())
+    # select, staging rows keep the file they come from
+    sel = [c for c in [Fields.filename] + list(REN_COLS.values()) if c in df.columns]
     df = df[sel]
 
     # data types
     df[Fields.date] = pd.to_datetime(df[Fields.date], format="%Y%m%d")
-    df[Fields.ga_sessions] = df[Fields.ga_sessions].astype("int", errors="ignore")
-    df[Fields.ga_users] = df[Fields.ga_users].astype("int", errors="ignore")
 
-    # fill missing
-    df[Fields.ga_source] = df[Fields.ga_source].fillna(Fields.missing)
-    df[Fields.ga_channel_grouping] = df[Fields.ga_channel_grouping].fillna(Fields.missing)
-    df[Fields.ga_sessions] = df[Fields.ga_sessions].fillna(0)
-    df[Fields.ga_users] = df[Fields.ga_users].fillna(0)
+    # fill missing, once per distinct value
+    df = normalise(df, {
+        Fields.ga_source: {"fillna": Fields.missing},
+        Fields.ga_channel_grouping: {"fillna": Fields.missing},
+        Fields.ga_sessions: {"fillna": 0},
+        Fields.ga_users: {"fillna": 0},
+    })
+
+    # compact types
+    df = cast_frame(df, Schemas.ga)
 
     return df
 
 
-def trunc_staging(bronze_df, staging_df):
-    dates = bronze_df[Fields.date].unique()
-    mask = staging_df[Fields.date].isin(dates)
+def read_staging(files):
+    # raw dtypes
+    dtypes = {
+        "date": str,
+        "source": str,
+        "channelGrouping": str,
+        "sessions": "Int64",
+        "users": "Int64",
+    }
+
+    # read files
+    df = read_staging_files(
+        container=Storage.staging,
+        files=files,
+        dtype=dtypes,
+    )
+
+    return clean_report(df)
+
+
+def read_rollup(file_path, schema):
+
+    # columns of the current schema, missing ones are empty
+    try:
+        return read_parquet(Storage.bronze, file_path).reindex(columns=schema.names)
+
+    except FileNotFoundError:
+        return schema.empty_table().to_pandas()
+
+
+def aggregate(df_in, keys):
+
+    # GA counts a user once per source, summed users would count some twice
+    df = (
+        df_in
+        .groupby(keys, observed=True, sort=True)[[Fields.ga_sessions]]
+        .sum()
+        .reset_index()
+    )
+    df[Fields.ga_users] = None
+
+    return df
+
+
+def update_rollups(df_in, bronze_dates, exact=None):
+    """Replaces the rollup rows of the dates in df_in with their aggregates.
+
+    exact maps rollup files to rows the API returned at their level, with exact
+    users. Rollups built from source level rows only, e.g. from staging, leave
+    users empty. Bronze dates missing from the rollups, all of them the first
+    time, are read back from the partitioned dataset and added too.
+    """
+
+    rollups = {file_path: read_rollup(file_path, schema) for file_path, _, schema in ROLLUPS}
+    dates = pd.DatetimeIndex(df_in[Fields.date].unique())
+
+    # partitions missing from any rollup
+    missing = pd.DatetimeIndex([])
+    for rollup_df in rollups.values():
+        rollup_dates = pd.DatetimeIndex(rollup_df[Fields.date].unique())
+        missing = missing.union(pd.DatetimeIndex(bronze_dates).difference(rollup_dates))
+    missing = missing.difference(dates)
+
+    df = df_in[ROLLUP_COLUMNS]
+    if len(missing) > 0:
+        logger.info(f"Adding {len(missing)} business dates to the google analytics rollups")
+        missing_df = read_dataset(Storage.bronze, Storage.bronze_ga, columns=ROLLUP_COLUMNS, dates=missing)
+        df = concat_frames([df, missing_df])
+        dates = dates.union(missing)
+    if len(dates) == 0:
+        return
+
+    for file_path, keys, schema in ROLLUPS:
+        new_df = aggregate(df, keys)
+        if exact is not None and file_path in exact:
+            exact_df = exact[file_path][keys + [Fields.ga_sessions, Fields.ga_users]]
+            new_df = concat_frames([exact_df, new_df[~new_df[Fields.date].isin(exact_df[Fields.date])]])
+
+        rollup_df = rollups[file_path]
+        rollup_df = rollup_df[~rollup_df[Fields.date].isin(dates)]
+        rollup_df = concat_frames([rollup_df, new_df]).sort_values(keys, ignore_index=True)
+        write_parquet(dataframe=rollup_df, container=Storage.bronze, file_path=file_path, schema=schema)
+
+
+def trunc_staging(bronze_dates, staging_df):
+    mask = staging_df[Fields.date].isin(bronze_dates)
     trunc_df = staging_df[~mask]
 
     return trunc_df
 
 
 def main():
-    # read bronze
-    bronze_df = read_bronze()
+    # list new or changed staging files
+    manifest_df = read_manifest(Storage.manifest_ga)
+    blobs = list_blob_properties(container_name=Storage.staging, blob_path=Storage.staging_ga)
+    blobs = new_staging_files(blobs, manifest_df)
+    if len(blobs) == 0:
+        logger.info("No new staging files for google analytics")
+        return
+
+    # business dates already in bronze
+    bronze_dates = read_bronze_dates()
 
     # read staging
-    staging_df = read_staging()
+    staging_df = read_staging(files=[b["name"] for b in blobs])
 
     # drop form staging already available data
-    trunc_df = trunc_staging(bronze_df=bronze_df, staging_df=staging_df)
-
-    # append to bronze
-    df = pd.concat([
-        bronze_df,
-        trunc_df.drop(columns=Fields.filename)
-    ])
+    trunc_df = trunc_staging(bronze_dates=bronze_dates, staging_df=staging_df)
+    df = trunc_df.drop(columns=Fields.filename)
 
-    # write
-    write_parquet(
+    # write new business dates only
+    write_partitions(
         dataframe=df,
         container=Storage.bronze,
-        file_path=Storage.bronze_ga,
+        dataset_path=Storage.bronze_ga,
+        schema=Schemas.ga,
     )
 
-    # delete files from blob
-    files = list(staging_df[Fields.filename].unique())
-    #delete_staging_files(files)
+    # rollups of the new business dates
+    update_rollups(df, bronze_dates)
+
+    # mark files as processed
+    update_manifest(Storage.manifest_ga, manifest_df, blobs, staging_df)
 
 
 if __name__ == "__main__":
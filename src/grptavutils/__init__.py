@@ -1,100 +1,284 @@
+import io
 import json
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from grptavutils.constants import Storage
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from grptavutils.constants import Fields, Storage
+from grptavutils.cache import get_cache
+from grptavutils.frames import get_frame_store
 from grptavutils.logs import logger
+from grptavutils.metrics import bind, instrumented
+from grptavutils.schemas import cast_frame
+from grptavutils.session import get_session
+
+# pyarrow sets up its pandas support lazily and not thread safely, the io
+# thread pools below must not be the first to use it
+pa.Table.from_pandas(pd.DataFrame())
 
-def list_blob_files(container_name, blob_path):
 
-    # init client
-    with open("../../secrets/azure_creds.json", "r") as f:
-        connection_string = json.load(f)
-    connection_string = connection_string["connection_string"]
-    blob_source_service_client = BlobServiceClient.from_connection_string(connection_string)
-    source_container_client = blob_source_service_client.get_container_client(container_name)
+@instrumented("other")
+def list_blob_files(container_name, blob_path):
 
     # get files
     blob_name_list = []
-    source_blob_list = source_container_client.list_blobs(name_starts_with=blob_path)
-    for f in source_blob_list:
+    for f in get_session().list_blobs(container_name, blob_path):
         blob_name_list.append(f["name"])
 
     return blob_name_list
 
 
-def delete_blob_file(container_name, file_path):
+@instrumented("other")
+def list_blob_properties(container_name, blob_path):
+
+    # get files with etag, last modified and size
+    return get_session().list_blobs(container_name, blob_path)
+
 
-    # init client
-    with open("../../secrets/azure_creds.json", "r") as f:
-        connection_string = json.load(f)
-    connection_string = connection_string["connection_string"]
-    blob_source_service_client = BlobServiceClient.from_connection_string(connection_string)
-    source_container_client = blob_source_service_client.get_container_client(container_name)
+@instrumented("other")
+def delete_blob_file(container_name, file_path):
 
     # delete file
-    source_container_client.delete_blob(file_path, snapshot=None)
+    get_session().delete_blob(container_name, file_path)
+
+    frame_store = get_frame_store()
+    if frame_store is not None:
+        frame_store.discard(container_name, file_path)
+
+
+def cached_path(container, file_path, etag=None):
+
+    # local copy of an unchanged blob, None when the cache is disabled
+    cache = get_cache()
+    if cache is None:
+        return None
+
+    session = get_session()
+    if etag is None:
+        etag = session.blob_properties(container, file_path)["etag"]
+
+    path = cache.get(container, file_path, etag)
+    if path is None:
+        data, etag = session.download(container, file_path)
+        path = cache.put(container, file_path, etag, data)
+
+    return path
+
+
+@instrumented("read")
+def read_parquet(container, file_path, columns=None, filters=None, etag=None):
+
+    # frames written earlier in the same pipeline run are served from memory
+    frame_store = get_frame_store()
+    if frame_store is not None:
+        df = frame_store.get(container, file_path, columns=columns, filters=filters)
+        if df is not None:
+            return df
+
+    # served memory-mapped from the local cache when enabled, directories are read remotely
+    path = None if file_path.endswith("/") else cached_path(container, file_path, etag)
+    if path is not None:
+        try:
+            df = pd.read_parquet(path, engine="pyarrow", columns=columns, filters=filters, memory_map=True)
+            return df
+        except FileNotFoundError:
+            # evicted in the meantime, read remotely
+            pass
+
+    # columns and filters (pyarrow DNF, e.g. [("date", ">=", start)]) are pushed
+    # down so only the needed column chunks and row groups are fetched
+    session = get_session()
+    if file_path.endswith("/"):
+        # directory of parquet files
+        df = pd.read_parquet(
+            session.path(container, file_path),
+            engine="pyarrow",
+            columns=columns,
+            filters=filters,
+            filesystem=session.filesystem(container),
+        )
+    else:
+        with session.open(container, file_path, "rb") as f:
+            df = pd.read_parquet(f, engine="pyarrow", columns=columns, filters=filters)
 
+    return df
 
 
-def read_parquet(container, file_path):
+@instrumented("read")
+def read_excel(container, file_path):
 
-    # get azure access credentials
-    with open("../../secrets/azure_creds.json", "r") as f:
-        storage_options = json.load(f)
+    path = cached_path(container, file_path)
+    if path is not None:
+        try:
+            df = pd.read_excel(path)
+            return df
+        except FileNotFoundError:
+            # evicted in the meantime, read remotely
+            pass
 
-    account_name = Storage.account_name
-    df = pd.read_parquet(
-        f"abfs://{container}@{account_name}.dfs.core.windows.net/{file_path}",
-        storage_options=storage_options
-    )
+    with get_session().open(container, file_path, "rb") as f:
+        df = pd.read_excel(f)
 
     return df
 
 
-def read_excel(container, file_path):
+@instrumented("read")
+def read_csv(container, file_path, sep=",", decimal=".", dtype=None):
 
-    # get azure access credentials
-    with open("../../secrets/azure_creds.json", "r") as f:
-        storage_options = json.load(f)
+    with get_session().open(container, file_path, "rb") as f:
+        df = pd.read_csv(
+            f,
+            sep=sep,
+            decimal=decimal,
+            dtype=dtype,
+        )
 
-    account_name = Storage.account_name
-    df = pd.read_excel(
-        f"abfs://{container}@{account_name}.dfs.core.windows.net/{file_path}",
-        storage_options=storage_options
-    )
+    return df
+
+
+def _read_staging_file(container, file_path, file_format, read_kwargs):
+
+    try:
+        if file_format == "csv":
+            df = read_csv(container=container, file_path=file_path, **read_kwargs)
+        else:
+            df = read_parquet(container=container, file_path=file_path)
+    except pd.errors.EmptyDataError:
+        delete_blob_file(container_name=container, file_path=file_path)
+        logger.info(f"Deleted empty file {file_path} from container {container}")
+        return None
+
+    df[Fields.filename] = file_path
 
     return df
 
-def read_csv(container, file_path, sep=",", decimal="."):
 
-    # get azure access credentials
-    with open("../../secrets/azure_creds.json", "r") as f:
-        storage_options = json.load(f)
+def read_staging_files(container, blob_path=None, files=None, file_format="csv", max_workers=Storage.max_workers,
+                       **read_kwargs):
+
+    if files is None:
+        files = list_blob_files(container_name=container, blob_path=blob_path)
 
-    account_name = Storage.account_name
-    df = pd.read_csv(
-        f"abfs://{container}@{account_name}.dfs.core.windows.net/{file_path}",
-        sep=sep,
-        decimal=decimal,
-        storage_options=storage_options
+    # download and parse concurrently, concat once
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        dfs = list(executor.map(
+            bind(lambda f: _read_staging_file(container, f, file_format, read_kwargs)),
+            files
+        ))
+    dfs = [d for d in dfs if d is not None]
+
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=[Fields.filename])
+
+    return pd.concat(dfs, ignore_index=True)
+
+
+@instrumented("read")
+def read_csv_table(container, file_path, sep=",", include_columns=None, column_types=None, timestamp_parsers=None):
+
+    # multithreaded arrow parsing, only the requested columns are converted
+    read_options = pa_csv.ReadOptions(use_threads=True)
+    parse_options = pa_csv.ParseOptions(delimiter=sep)
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=include_columns,
+        include_missing_columns=include_columns is not None,
+        column_types=column_types,
+        timestamp_parsers=timestamp_parsers,
+        strings_can_be_null=True,
     )
 
-    return df
+    with get_session().open(container, file_path, "rb") as f:
+        table = pa_csv.read_csv(
+            f,
+            read_options=read_options,
+            parse_options=parse_options,
+            convert_options=convert_options,
+        )
 
+    return table
 
-def write_parquet(dataframe, container, file_path):
 
-    # get azure access credentials
-    with open("../../secrets/azure_creds.json", "r") as f:
-        storage_options = json.load(f)
+def _read_staging_table(container, file_path, read_kwargs):
 
-    account_name = Storage.account_name
+    try:
+        table = read_csv_table(container=container, file_path=file_path, **read_kwargs)
+    except pa.ArrowInvalid as e:
+        if "Empty CSV file" not in str(e):
+            raise
+        delete_blob_file(container_name=container, file_path=file_path)
+        logger.info(f"Deleted empty file {file_path} from container {container}")
+        return None
 
-    dataframe.to_parquet(
-        f"abfs://{container}@{account_name}.dfs.core.windows.net/{file_path}",
-        index=False,
-        storage_options=storage_options
+    filename = pa.DictionaryArray.from_arrays(
+        pa.array(np.zeros(table.num_rows, dtype="int32")),
+        pa.array([file_path]),
     )
+    table = table.append_column(Fields.filename, filename)
+
+    return table
+
+
+def read_staging_tables(container, files, max_workers=Storage.max_workers, **read_kwargs):
+
+    # download and parse concurrently, concat once as arrow
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        tables = list(executor.map(
+            bind(lambda f: _read_staging_table(container, f, read_kwargs)),
+            files
+        ))
+    tables = [t for t in tables if t is not None]
+
+    if len(tables) == 0:
+        column_types = read_kwargs.get("column_types") or {}
+        schema = pa.schema(
+            [(c, column_types.get(c, pa.string())) for c in read_kwargs.get("include_columns") or []]
+            + [(Fields.filename, pa.string())]
+        )
+        return schema.empty_table()
+
+    return pa.concat_tables(tables, promote=True)
+
+
+@instrumented("write")
+def write_parquet(dataframe, container, file_path, schema=None):
+
+    if schema is not None:
+        dataframe = cast_frame(dataframe, schema)
+
+    buffer = io.BytesIO()
+    dataframe.to_parquet(buffer, engine="pyarrow", index=False)
+    data = buffer.getvalue()
+    etag = get_session().upload(container, file_path, data)
+
+    # write-through, so later steps read the new file locally
+    cache = get_cache()
+    if cache is not None:
+        cache.put(container, file_path, etag, data)
+
+    # keep the written frame for the steps downstream in the same run
+    frame_store = get_frame_store()
+    if frame_store is not None:
+        frame_store.put(container, file_path, dataframe.reset_index(drop=True))
+
+    logger.info(f"Saved file {file_path} into container {container}")
+
+
+@instrumented("write")
+def write_csv(dataframe, container, file_path, **to_csv_kwargs):
+
+    buffer = io.BytesIO()
+    dataframe.to_csv(buffer, index=False, **to_csv_kwargs)
+    get_session().upload(container, file_path, buffer.getvalue())
+
+    logger.info(f"Saved file {file_path} into container {container}")
+
+
+@instrumented("write")
+def write_json(obj, container, file_path):
+
+    get_session().upload(container, file_path, json.dumps(obj).encode("utf-8"))
+
     logger.info(f"Saved file {file_path} into container {container}")
 
 
@@ -103,4 +287,3 @@ def delete_staging_files(files):
     for f in files:
         delete_blob_file(container_name=Storage.staging, file_path=f)
         logger.info(f"Deleted file {f} from container {Storage.staging}")
-
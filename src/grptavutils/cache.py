@@ -0,0 +1,131 @@
+import collections
+import hashlib
+import os
+import threading
+import uuid
+from grptavutils.constants import Storage
+from grptavutils.logs import logger
+
+
+class BlobCache:
+    """Local read-through cache of blobs, keyed by blob path and etag.
+
+    Files are evicted least recently used first once the cache grows over
+    max_bytes. The recency order and total size are kept in memory and the
+    directory, which other processes may share, is only scanned when the cache
+    fills up. Eviction goes down to low_water of max_bytes so that happens
+    rarely.
+    """
+
+    low_water = 0.9
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes = None
+        self._total = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def local_path(self, container, file_path, etag):
+        key = hashlib.sha1(f"{container}/{file_path}|{etag}".encode()).hexdigest()
+        extension = os.path.splitext(file_path)[1]
+
+        return os.path.join(self.cache_dir, key[:2], key + extension)
+
+    def _scan(self):
+
+        # cached files from the least to the most recently used
+        files = []
+        for root, _, filenames in os.walk(self.cache_dir):
+            for fn in filenames:
+                if fn.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, fn)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+
+        self._sizes = collections.OrderedDict((path, size) for _, path, size in sorted(files))
+        self._total = sum(self._sizes.values())
+
+    def _index(self):
+        if self._sizes is None:
+            self._scan()
+
+        return self._sizes
+
+    def get(self, container, file_path, etag):
+        path = self.local_path(container, file_path, etag)
+        if not os.path.exists(path):
+            return None
+
+        # mark as recently used, the mtime keeps the order for other processes
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            sizes = self._index()
+            if path in sizes:
+                sizes.move_to_end(path)
+
+        return path
+
+    def put(self, container, file_path, etag, data):
+        path = self.local_path(container, file_path, etag)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write aside and move in place so readers never see partial files
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            sizes = self._index()
+            self._total += len(data) - sizes.pop(path, 0)
+            sizes[path] = len(data)
+        if self._total > self.max_bytes:
+            self.evict(keep=path)
+
+        return path
+
+    def evict(self, keep=None):
+        with self._lock:
+            # other processes sharing the directory may have added or removed files
+            self._scan()
+            for path, size in list(self._sizes.items()):
+                if self._total <= self.max_bytes * self.low_water:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                del self._sizes[path]
+                self._total -= size
+                logger.info(f"Evicted {path} from blob cache")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Returns the blob cache, or None when GRPTAV_CACHE_DIR is not set."""
+    global _cache
+
+    with _cache_lock:
+        cache_dir = os.environ.get(Storage.cache_dir_env)
+        if cache_dir is None:
+            return None
+
+        if _cache is None or _cache.cache_dir != cache_dir:
+            max_bytes = int(os.environ.get(Storage.cache_max_bytes_env, Storage.cache_max_bytes))
+            _cache = BlobCache(cache_dir, max_bytes)
+
+        return _cache
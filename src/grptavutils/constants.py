@@ -4,6 +4,11 @@ class Fields:
 
     # generic
     filename = "filename"
+    etag = "etag"
+    last_modified = "last_modified"
+    row_count = "row_count"
+    processed_time = "processed_time"
+    version = "version"
     date = "date"
     execution_time = "execution_time"
     relative_days = "relative_days"
@@ -11,6 +16,8 @@ class Fields:
     day_of_week = "day_of_week"
 
     # google analytics
+    ga_view_id = "ga_view_id"
+    ga_requests = "ga_requests"
     ga_source = "ga_source"
     ga_channel_grouping = "ga_channel_grouping"
     ga_sessions = "ga_sessions"
@@ -69,6 +76,7 @@ class Fields:
 
     period_of_day = "period_of_day"
     shift_id = "shift_id"
+    shift_key = "shift_key"
 
     # severooms
     venue_name = "venue_name"
@@ -112,6 +120,11 @@ class Fields:
     prepayment_onsite_gross_usd = "prepayment_onsite_gross_usd"
     prepayment_onsite_net_usd = "prepayment_onsite_net_usd"
     menu_item_cost = "menu_item_cost"
+    appetizers_flag = "appetizers_flag"
+    bread_flag = "bread_flag"
+    sides_flag = "sides_flag"
+    wine_weighted_flag = "wine_weighted_flag"
+    menu_flag = "menu_flag"
     margin = "margin"
     total_cost = "total_cost"
 
@@ -123,10 +136,67 @@ class Storage:
     silver = "silver"
     account_name = "gruppotavolastorage"
 
+    # storage backend, azure, azurite (emulator) or local (directory tree)
+    backend_env = "GRPTAV_STORAGE_BACKEND"
+    backend = "azure"
+    local_root_env = "GRPTAV_STORAGE_ROOT"
+    local_root = "../../data"
+    azurite_connection_string_env = "GRPTAV_AZURITE_CONNECTION_STRING"
+    azurite_connection_string = (
+        "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+        "AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;"
+        "BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;"
+    )
+
+    # credentials and connection pool
+    creds_path = "../../secrets/azure_creds.json"
+    max_connections = 16
+    max_workers = 8
+
+    # worker processes of the sharded cleaners, staging bytes per shard
+    max_processes = 4
+    shard_bytes_env = "GRPTAV_SHARD_BYTES"
+    shard_bytes = 256 * 1024 ** 2
+
+    # a single shard is spread over the processes only above either size, below
+    # them starting the processes takes longer than cleaning it inline
+    pool_bytes_env = "GRPTAV_POOL_BYTES"
+    pool_bytes = 64 * 1024 ** 2
+    pool_rows_env = "GRPTAV_POOL_ROWS"
+    pool_rows = 250000
+    transfer_concurrency = 4
+
+    # optional archive of the raw GA responses written straight to bronze
+    ga_archive_env = "GRPTAV_GA_ARCHIVE"
+
+    # frames handed in memory between the steps of a pipeline run
+    frame_store_max_bytes = 512 * 1024 ** 2
+
+    # optional local blob cache
+    cache_dir_env = "GRPTAV_CACHE_DIR"
+    cache_max_bytes_env = "GRPTAV_CACHE_MAX_BYTES"
+    cache_max_bytes = 5 * 1024 ** 3
+
+    # staging prefixes
+    staging_ga = "googleanalytics/"
+    staging_ga_raw = "googleanalytics_raw/"
+    staging_oracle_employees = "oracle/Employee"
+    staging_oracle_guests = "oracle/Guest"
+
+    # partitioned datasets, one date=YYYY-MM-DD folder per business date
+    bronze_ga = "googleanalytics/googleanalytics"
+    bronze_oracle_employees = "oracle/employees"
+    bronze_oracle_guests = "oracle/guests"
+    bronze_oracle_guests_index = "oracle/guests_index"
+    bronze_yesterday_reservations = "sevenrooms/yesterday"
+
+    # single-file datasets replaced by the partitioned ones
+    legacy_bronze_ga = "googleanalytics/googleanalytics.parquet"
+    legacy_bronze_oracle_employees = "oracle/employees.parquet"
+    legacy_bronze_oracle_guests = "oracle/guests.parquet"
+    legacy_bronze_yesterday_reservations = "sevenrooms/yesterday.parquet"
+
     # filepaths
-    bronze_ga = "googleanalytics/googleanalytics.parquet"
-    bronze_oracle_employees = "oracle/employees.parquet"
-    bronze_oracle_guests = "oracle/guests.parquet"
     silver_dates = "dates/dates.parquet"
     silver_employees = "employees/employees.parquet"
     silver_items = "items/items.parquet"
@@ -135,5 +205,25 @@ class Storage:
     item_cost = "external_uploads/item_cost.xlsx"
     future_reservations = "sevenrooms/future/"
     yesterday_reservations = "sevenrooms/yesterday/"
-    bronze_yesterday_reservations = "sevenrooms/yesterday.parquet"
     bronze_future_reservations = "sevenrooms/future.parquet"
+    bronze_yesterday_reservations_index = "sevenrooms/yesterday_index.parquet"
+    bronze_oracle_item_descriptions = "oracle/item_descriptions.parquet"
+    bronze_oracle_item_state = "oracle/item_state.parquet"
+    bronze_oracle_item_dates = "oracle/item_dates.parquet"
+    bronze_oracle_guests_hours = "oracle/guests_hours.parquet"
+    bronze_ga_checkpoint = "googleanalytics/checkpoint.parquet"
+    bronze_ga_quota = "googleanalytics/quota.parquet"
+    bronze_ga_channels = "googleanalytics/channels.parquet"
+    bronze_ga_daily = "googleanalytics/daily.parquet"
+
+    # processed staging manifests
+    manifest_ga = "manifests/googleanalytics.parquet"
+    manifest_oracle_employees = "manifests/oracle_employees.parquet"
+    manifest_oracle_guests = "manifests/oracle_guests.parquet"
+    manifest_yesterday_reservations = "manifests/sevenrooms_yesterday.parquet"
+
+    # typed versions of the external uploads, one folder per dimension
+    dimensions = "dimensions/"
+
+    # pipeline step metrics, one file per run under the date of the run
+    metrics_runs = "metrics/runs"
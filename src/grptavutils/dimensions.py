@@ -0,0 +1,66 @@
+import datetime
+import pandas as pd
+from grptavutils import read_excel, read_parquet, write_parquet
+from grptavutils.constants import Fields, Storage
+from grptavutils.logs import logger
+from grptavutils.session import get_session
+
+
+def _versions_path(name):
+    return f"{Storage.dimensions}{name}/versions.parquet"
+
+
+def read_versions(name):
+    try:
+        df = read_parquet(Storage.bronze, _versions_path(name))
+        return df
+
+    except FileNotFoundError:
+        empty_df = pd.DataFrame(columns=[
+            Fields.version,
+            Fields.filename,
+            Fields.etag,
+            Fields.last_modified,
+            Fields.row_count,
+            Fields.processed_time,
+        ])
+
+        return empty_df
+
+
+def read_dimension(name, source_path, convert, schema=None):
+    """Typed parquet copy of an uploaded excel workbook.
+
+    A new version is written the first time the upload's etag changes, with
+    convert(df) applied to the parsed sheet. Later runs read the parquet copy.
+    """
+
+    props = get_session().blob_properties(Storage.bronze, source_path)
+    versions_df = read_versions(name)
+
+    # current version still matches the upload
+    if len(versions_df) > 0:
+        current = versions_df.iloc[-1]
+        if current[Fields.etag] == props["etag"]:
+            return read_parquet(Storage.bronze, current[Fields.filename])
+
+    # parse the new upload once
+    df = convert(read_excel(Storage.bronze, source_path))
+    version = len(versions_df) + 1
+    file_path = f"{Storage.dimensions}{name}/v{version:04d}.parquet"
+    write_parquet(dataframe=df, container=Storage.bronze, file_path=file_path, schema=schema)
+
+    # register the version after its data is in place
+    version_df = pd.DataFrame({
+        Fields.version: [version],
+        Fields.filename: [file_path],
+        Fields.etag: [props["etag"]],
+        Fields.last_modified: [props["last_modified"]],
+        Fields.row_count: [len(df)],
+        Fields.processed_time: [datetime.datetime.now()],
+    })
+    versions_df = pd.concat([versions_df, version_df], ignore_index=True)
+    write_parquet(dataframe=versions_df, container=Storage.bronze, file_path=_versions_path(name))
+    logger.info(f"Saved version {version} of dimension {name} from {source_path}")
+
+    return read_parquet(Storage.bronze, file_path)
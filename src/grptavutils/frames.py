@@ -0,0 +1,145 @@
+import collections
+import operator
+import threading
+import pandas as pd
+from grptavutils.constants import Storage
+
+_operators = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+class FrameStore:
+    """In-memory copies of the frames written during a pipeline run.
+
+    Steps running in the same process read what earlier steps wrote from
+    here instead of downloading it again. Only blobs a pending step declared
+    as input are kept, they are released once their last consumer is done and
+    the oldest frames are dropped when the store grows over max_bytes.
+    """
+
+    def __init__(self, max_bytes=Storage.frame_store_max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._frames = collections.OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._consumers = {}
+
+    def _wanted(self, key):
+        for prefix, n in self._consumers.items():
+            if n > 0 and _under(key, prefix):
+                return True
+
+        return False
+
+    def _drop(self, key):
+        self._frames.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def want(self, blobs):
+        """Declares one more consumer of every blob, a container/path prefix."""
+
+        with self._lock:
+            for b in blobs:
+                self._consumers[b] = self._consumers.get(b, 0) + 1
+
+    def release(self, blobs):
+        """One consumer of every blob is done, frames nobody waits for are dropped."""
+
+        with self._lock:
+            for b in blobs:
+                self._consumers[b] = max(self._consumers.get(b, 0) - 1, 0)
+            for key in list(self._frames):
+                if not self._wanted(key):
+                    self._drop(key)
+
+    def put(self, container, file_path, df):
+        key = f"{container}/{file_path}"
+        size = int(df.memory_usage(deep=True).sum())
+
+        with self._lock:
+            self._drop(key)
+            if size > self.max_bytes or not self._wanted(key):
+                return
+
+            # oldest frames out first, they are read again from storage if needed
+            while self._bytes + size > self.max_bytes:
+                self._drop(next(iter(self._frames)))
+            self._frames[key] = df
+            self._sizes[key] = size
+            self._bytes += size
+
+    def get(self, container, file_path, columns=None, filters=None):
+        with self._lock:
+            df = self._frames.get(f"{container}/{file_path}")
+        if df is None:
+            return None
+
+        df = apply_filters(df, filters)
+        if columns is not None:
+            df = df[columns]
+
+        return df.copy()
+
+    def discard(self, container, file_path):
+        with self._lock:
+            self._drop(f"{container}/{file_path}")
+
+    def clear(self):
+        with self._lock:
+            self._frames = collections.OrderedDict()
+            self._sizes = {}
+            self._bytes = 0
+            self._consumers = {}
+
+
+def _under(key, prefix):
+    return key == prefix or key.startswith(prefix.rstrip("/") + "/")
+
+
+def apply_filters(df, filters):
+    """Evaluates pyarrow DNF filters on a pandas frame."""
+
+    if not filters:
+        return df
+
+    # a flat list of tuples is a single conjunction
+    if isinstance(filters[0], tuple):
+        filters = [filters]
+
+    mask = pd.Series(False, index=df.index)
+    for conjunction in filters:
+        conjunction_mask = pd.Series(True, index=df.index)
+        for col, op, value in conjunction:
+            if op == "in":
+                conjunction_mask &= df[col].isin(value)
+            elif op == "not in":
+                conjunction_mask &= ~df[col].isin(value)
+            else:
+                conjunction_mask &= _operators[op](df[col], value)
+        mask |= conjunction_mask
+
+    return df[mask]
+
+
+_store = None
+
+
+def enable_frame_store():
+    global _store
+
+    if _store is None:
+        _store = FrameStore()
+
+    return _store
+
+
+def get_frame_store():
+    return _store
@@ -0,0 +1,67 @@
+import datetime
+import pandas as pd
+from grptavutils import read_parquet, write_parquet
+from grptavutils.constants import Fields, Storage
+
+
+def read_manifest(file_path):
+    try:
+        df = read_parquet(Storage.bronze, file_path)
+        return df
+
+    except FileNotFoundError:
+        empty_df = pd.DataFrame(columns=[
+            Fields.filename,
+            Fields.etag,
+            Fields.last_modified,
+            Fields.row_count,
+            Fields.processed_time,
+        ])
+
+        return empty_df
+
+
+def new_staging_files(blobs, manifest_df):
+
+    # files never processed or changed since they were processed
+    processed = set(zip(manifest_df[Fields.filename], manifest_df[Fields.etag]))
+    new_blobs = [b for b in blobs if (b["name"], b["etag"]) not in processed]
+
+    return new_blobs
+
+
+def staging_row_counts(staging_df):
+    return staging_df.groupby(Fields.filename).size()
+
+
+def update_manifest(file_path, manifest_df, blobs, staging_df=None, row_counts=None):
+
+    # rows parsed from every processed file
+    if row_counts is None:
+        row_counts = staging_row_counts(staging_df)
+
+    processed_df = pd.DataFrame({
+        Fields.filename: [b["name"] for b in blobs],
+        Fields.etag: [b["etag"] for b in blobs],
+        Fields.last_modified: [b["last_modified"] for b in blobs],
+    })
+    processed_df[Fields.row_count] = (
+        row_counts
+        .reindex(processed_df[Fields.filename])
+        .fillna(0)
+        .astype("int64")
+        .to_numpy()
+    )
+    processed_df[Fields.processed_time] = datetime.datetime.now()
+
+    # replace entries of reprocessed files
+    mask = manifest_df[Fields.filename].isin(processed_df[Fields.filename])
+    df = pd.concat([manifest_df[~mask], processed_df], ignore_index=True)
+
+    write_parquet(
+        dataframe=df,
+        container=Storage.bronze,
+        file_path=file_path,
+    )
+
+    return df
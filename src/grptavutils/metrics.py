@@ -0,0 +1,409 @@
+import contextlib
+import contextvars
+import datetime
+import functools
+import importlib
+import inspect
+import json
+import os
+import resource
+import threading
+import time
+import uuid
+import pandas as pd
+import pyarrow as pa
+from grptavutils.logs import logger
+
+# metrics of the pipeline step running in the current context
+_current_step = contextvars.ContextVar("current_step", default=None)
+
+
+class StepMetrics:
+    """Counters of one pipeline step, updated from every thread working for it."""
+
+    counters = [
+        "rows_in", "rows_out", "bytes_read", "bytes_written",
+        "read_calls", "write_calls", "other_calls", "io_seconds",
+        "worker_cpu_seconds",
+    ]
+
+    # counters kept as the largest value reported, not summed
+    maxima = ["worker_peak_rss_bytes"]
+
+    def __init__(self, run_id, step):
+        self.run_id = run_id
+        self.step = step
+        self.status = None
+        self.start_time = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_bytes = 0
+        for c in self.counters + self.maxima:
+            setattr(self, c, 0)
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def add(self, **counters):
+        with self._lock:
+            for c, v in counters.items():
+                if c in self.maxima:
+                    setattr(self, c, max(getattr(self, c), v))
+                else:
+                    setattr(self, c, getattr(self, c) + v)
+
+    def add_phase(self, phase, calls=0, seconds=0.0, rows=0, peak_rss_bytes=0):
+        with self._lock:
+            record = self.phases.setdefault(phase, {"calls": 0, "seconds": 0.0, "rows": 0, "peak_rss_bytes": 0})
+            record["calls"] += calls
+            record["seconds"] += seconds
+            record["rows"] += rows
+            record["peak_rss_bytes"] = max(record["peak_rss_bytes"], peak_rss_bytes)
+
+    def to_dict(self):
+        record = {
+            "run_id": self.run_id,
+            "step": self.step,
+            "status": self.status,
+            "start_time": self.start_time.isoformat(),
+            "wall_seconds": round(self.wall_seconds, 3),
+            "cpu_seconds": round(self.cpu_seconds + self.worker_cpu_seconds, 3),
+            "peak_rss_bytes": self.peak_rss_bytes,
+        }
+        for c in self.counters + self.maxima:
+            record[c] = getattr(self, c)
+        record["io_seconds"] = round(record["io_seconds"], 3)
+        record["worker_cpu_seconds"] = round(record["worker_cpu_seconds"], 3)
+
+        return record
+
+
+def new_run_id():
+    return f"{datetime.datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler(threading.Thread):
+    """Samples the resident memory in the background, for the peak of any window of time."""
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def run(self):
+        while True:
+            rss = rss_bytes()
+            with self._lock:
+                for w in self._windows:
+                    self._windows[w] = max(self._windows[w], rss)
+            time.sleep(self.interval)
+
+    def open(self):
+        window = uuid.uuid4().hex
+        with self._lock:
+            self._windows[window] = rss_bytes()
+
+        return window
+
+    def close(self, window):
+        rss = rss_bytes()
+        with self._lock:
+            return max(self._windows.pop(window), rss)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def rss_sampler():
+    global _sampler
+
+    # one sampler thread per process, started on first use
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = RssSampler()
+            _sampler.start()
+
+        return _sampler
+
+
+@contextlib.contextmanager
+def track_step(run_id, step):
+    """Collects the metrics of a step and logs them as one json line.
+
+    cpu time and peak rss of this process are process wide, steps running
+    concurrently share them. Shard workers report theirs separately.
+    """
+
+    metrics = StepMetrics(run_id, step)
+    token = _current_step.set(metrics)
+    metrics.start_time = datetime.datetime.now()
+    window = rss_sampler().open()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield metrics
+        metrics.status = "done"
+    except Exception:
+        metrics.status = "failed"
+        raise
+    finally:
+        _current_step.reset(token)
+        metrics.wall_seconds = time.perf_counter() - wall_start
+        metrics.cpu_seconds = time.process_time() - cpu_start
+        metrics.peak_rss_bytes = rss_sampler().close(window)
+        logger.info(f"metrics {json.dumps(metrics.to_dict())}")
+
+
+def current_step():
+    return _current_step.get()
+
+
+def add(**counters):
+    metrics = _current_step.get()
+    if metrics is not None:
+        metrics.add(**counters)
+
+
+def bind(fn):
+    """Runs fn in the caller's context, so pool threads report to the caller's step."""
+
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def counted(fn, *args):
+    """Runs fn in a fresh step and returns its result with the counters it collected.
+
+    Used in worker processes, whose counters, cpu time and peak rss are added
+    to the parent's step.
+    """
+
+    metrics = StepMetrics(None, None)
+    token = _current_step.set(metrics)
+    window = rss_sampler().open()
+    cpu_start = time.process_time()
+    try:
+        result = fn(*args)
+    finally:
+        _current_step.reset(token)
+        metrics.add(
+            worker_cpu_seconds=time.process_time() - cpu_start,
+            worker_peak_rss_bytes=rss_sampler().close(window),
+        )
+
+    usage = {c: getattr(metrics, c) for c in StepMetrics.counters + StepMetrics.maxima}
+    usage["phases"] = metrics.phases
+
+    return result, usage
+
+
+def add_usage(usage):
+    """Adds what counted() collected in a worker to the current step."""
+
+    metrics = _current_step.get()
+    if metrics is None:
+        return
+
+    usage = dict(usage)
+    for phase, record in usage.pop("phases", {}).items():
+        metrics.add_phase(phase, **record)
+    metrics.add(**usage)
+
+
+# module functions timed as phases of the running step, {module: {phase: [function names]}}
+_timed_phases = {}
+
+
+def _phase_rows(args, kwargs, result):
+
+    # rows produced, or rows handed in for functions not returning a frame
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return result.shape[0]
+    for a in list(args) + list(kwargs.values()):
+        if isinstance(a, (pd.DataFrame, pd.Series)):
+            return a.shape[0]
+
+    return 0
+
+
+def _timed(phase, fn):
+
+    def record(**values):
+        metrics = _current_step.get()
+        if metrics is not None:
+            metrics.add_phase(phase, **values)
+
+    if inspect.isgeneratorfunction(fn):
+
+        # time spent producing every item, not the caller's work in between
+        @functools.wraps(fn)
+        def generator_wrapper(*args, **kwargs):
+            items = fn(*args, **kwargs)
+            calls = 1
+            while True:
+                window = rss_sampler().open()
+                start = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    record(calls=calls, seconds=time.perf_counter() - start, peak_rss_bytes=rss_sampler().close(window))
+                    return
+                record(calls=calls, seconds=time.perf_counter() - start, peak_rss_bytes=rss_sampler().close(window))
+                calls = 0
+                yield item
+
+        return generator_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        window = rss_sampler().open()
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            peak = rss_sampler().close(window)
+        record(calls=1, seconds=seconds, rows=_phase_rows(args, kwargs, result), peak_rss_bytes=peak)
+
+        return result
+
+    return wrapper
+
+
+def patch_phases(phases):
+
+    # replace the module functions, returns the originals to restore them
+    originals = []
+    for module_name, module_phases in phases.items():
+        module = importlib.import_module(module_name)
+        for phase, names in module_phases.items():
+            for name in names:
+                fn = getattr(module, name)
+                originals.append((module, name, fn))
+                setattr(module, name, _timed(phase, fn))
+
+    return originals
+
+
+@contextlib.contextmanager
+def timed_phases(phases):
+    """Times the listed module functions as phases of the running step.
+
+    Shard workers started meanwhile time them too and report them through
+    counted().
+    """
+
+    global _timed_phases
+
+    originals = patch_phases(phases)
+    _timed_phases = phases
+    try:
+        yield
+    finally:
+        _timed_phases = {}
+        for module, name, fn in reversed(originals):
+            setattr(module, name, fn)
+
+
+def phases_to_time():
+    return _timed_phases
+
+
+def _num_rows(obj):
+    if isinstance(obj, pd.DataFrame):
+        return obj.shape[0]
+    if isinstance(obj, pa.Table):
+        return obj.num_rows
+
+    return 0
+
+
+def instrumented(kind):
+    """Counts calls, time and rows of a grptavutils io function.
+
+    kind is "read" (rows of the returned frame), "write" (rows of the dataframe
+    argument) or "other".
+    """
+
+    def decorator(fn):
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_step.get() is None:
+                return fn(*args, **kwargs)
+
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            counters = {"io_seconds": time.perf_counter() - start}
+            if kind == "read":
+                counters["read_calls"] = 1
+                counters["rows_in"] = _num_rows(result)
+            elif kind == "write":
+                counters["write_calls"] = 1
+                counters["rows_out"] = _num_rows(kwargs["dataframe"] if "dataframe" in kwargs else args[0])
+            else:
+                counters["other_calls"] = 1
+            add(**counters)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+class CountingFile:
+    """File wrapper adding the bytes read and written to the step that opened it.
+
+    The step is captured on open since arrow reads from its own io threads.
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._metrics = _current_step.get()
+
+    def _add(self, **counters):
+        if self._metrics is not None:
+            self._metrics.add(**counters)
+
+    def read(self, *args):
+        data = self._f.read(*args)
+        self._add(bytes_read=len(data))
+        return data
+
+    def read1(self, *args):
+        data = self._f.read1(*args)
+        self._add(bytes_read=len(data))
+        return data
+
+    def readinto(self, b):
+        n = self._f.readinto(b)
+        self._add(bytes_read=n or 0)
+        return n
+
+    def write(self, data):
+        self._add(bytes_written=len(data))
+        return self._f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
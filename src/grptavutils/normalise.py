@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+def _normalise_values(values, rules):
+
+    # replace, then capitalize, then fill missing, as the cleaners always did
+    if "replace" in rules:
+        values = values.replace(rules["replace"])
+    if rules.get("capitalize", False):
+        values = values.str.capitalize()
+    if "fillna" in rules:
+        values = values.fillna(rules["fillna"])
+
+    return values
+
+
+def normalise_strings(col, rules):
+    """Normalises a string column once per distinct value, returned as categorical."""
+
+    if not isinstance(col.dtype, pd.CategoricalDtype):
+        col = col.astype("category")
+
+    # distinct values plus the missing value, last
+    values = pd.Series(list(col.cat.categories) + [np.nan], dtype=object)
+    values = _normalise_values(values, rules)
+
+    # values that became equal share a category, missing rows take the last value
+    new_codes, categories = pd.factorize(values)
+    codes = new_codes[col.cat.codes.to_numpy()]
+
+    # used categories only and sorted, as astype("category") would give
+    used = np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(categories)))
+    order = used[categories.take(used).argsort()]
+    remap = np.full(len(categories) + 1, -1, dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    codes = remap[codes]
+
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories.take(order)), index=col.index, name=col.name)
+
+
+def normalise(df_in, spec):
+    """Applies a per-column spec of replace, capitalize and fillna rules.
+
+    spec maps columns to rules, e.g. {"name": {"capitalize": True, "fillna": "Missing"}}.
+    String rules run on the distinct values only and the column comes back
+    categorical, plain numeric fills are applied in one pass.
+    """
+
+    df = df_in.copy()
+    numeric_fill = {}
+    for col, rules in spec.items():
+        if col not in df.columns:
+            continue
+
+        # plain fills of counts and amounts need no string work
+        if set(rules) == {"fillna"} and not isinstance(rules["fillna"], str):
+            numeric_fill[col] = rules["fillna"]
+        else:
+            df[col] = normalise_strings(df[col], rules)
+
+    if len(numeric_fill) > 0:
+        df = df.fillna(numeric_fill)
+
+    return df
@@ -0,0 +1,207 @@
+import operator
+import re
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from grptavutils import list_blob_files, list_blob_properties, read_parquet, write_parquet, delete_blob_file
+from grptavutils.constants import Fields, Storage
+from grptavutils.logs import logger
+from grptavutils.metrics import bind
+from grptavutils.schemas import concat_frames
+
+_partition_pattern = re.compile(r"/date=(\d{4}-\d{2}-\d{2})/[^/]+\.parquet$")
+_comparisons = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def partition_prefix(dataset_path, date):
+    return f"{dataset_path}/date={pd.Timestamp(date):%Y-%m-%d}/"
+
+
+def partition_path(dataset_path, date, part_name="part-0"):
+    return f"{partition_prefix(dataset_path, date)}{part_name}.parquet"
+
+
+def list_partition_files(container, dataset_path, with_etags=False):
+
+    # map every parquet file of the dataset to its partition date
+    files = {}
+    etags = {}
+    for b in list_blob_properties(container_name=container, blob_path=f"{dataset_path}/"):
+        match = _partition_pattern.search(b["name"])
+        if match is not None:
+            files[b["name"]] = pd.Timestamp(match.group(1))
+            etags[b["name"]] = b["etag"]
+
+    if with_etags:
+        return files, etags
+
+    return files
+
+
+def list_partition_dates(container, dataset_path):
+
+    dates = set(list_partition_files(container, dataset_path).values())
+
+    return pd.DatetimeIndex(sorted(dates), name=Fields.date)
+
+
+def _read_partition_file(container, file_path, date, columns, filters, etag):
+
+    # date lives in the path, not in the file. Reading no column reads no row,
+    # date alone takes the whole file for its row count
+    file_columns = None
+    if columns is not None:
+        file_columns = [c for c in columns if c != Fields.date] or None
+
+    df = read_parquet(container=container, file_path=file_path, columns=file_columns, filters=filters, etag=etag)
+    df[Fields.date] = date
+    if columns is not None:
+        df = df[columns]
+
+    return df
+
+
+def _match_date(date, op, value):
+    if op in ("in", "not in"):
+        found = date in pd.DatetimeIndex(value)
+        return found if op == "in" else not found
+
+    return _comparisons[op](date, pd.Timestamp(value))
+
+
+def _partition_filters(date, filters):
+    """Filters of the rows of the partition of date, its date filters applied to the date itself.
+
+    filters are pyarrow DNF, a list of conjunctions or a single one. Returns
+    False when no row of the partition can match, None when every row does.
+    """
+
+    conjunctions = [filters] if isinstance(filters[0], tuple) else filters
+    rest_filters = []
+    for conjunction in conjunctions:
+        if all(_match_date(date, op, value) for c, op, value in conjunction if c == Fields.date):
+            rest = [(c, op, value) for c, op, value in conjunction if c != Fields.date]
+            if len(rest) == 0:
+                return None
+            rest_filters.append(rest)
+    if len(rest_filters) == 0:
+        return False
+
+    return rest_filters
+
+
+def read_dataset(container, dataset_path, columns=None, dates=None, start_date=None, end_date=None, filters=None):
+
+    files, etags = list_partition_files(container, dataset_path, with_etags=True)
+    if len(files) == 0:
+        raise FileNotFoundError(f"No partitions found for {dataset_path} in container {container}")
+
+    # prune partitions by name
+    if dates is not None:
+        dates = set(pd.DatetimeIndex(dates))
+        files = {f: d for f, d in files.items() if d in dates}
+    if start_date is not None:
+        files = {f: d for f, d in files.items() if d >= pd.Timestamp(start_date)}
+    if end_date is not None:
+        files = {f: d for f, d in files.items() if d <= pd.Timestamp(end_date)}
+
+    # date filters prune partitions too, the files have no date column
+    file_filters = {f: None for f in files}
+    if filters is not None and len(filters) > 0:
+        file_filters = {f: _partition_filters(d, filters) for f, d in files.items()}
+        files = {f: d for f, d in files.items() if file_filters[f] is not False}
+    if len(files) == 0:
+        return pd.DataFrame(columns=columns)
+
+    with ThreadPoolExecutor(max_workers=Storage.max_workers) as executor:
+        dfs = list(executor.map(
+            bind(lambda f: _read_partition_file(container, f, files[f], columns, file_filters[f], etags[f])),
+            files
+        ))
+
+    return concat_frames(dfs)
+
+
+def split_part_name(split_by, value, part_name):
+    return f"{split_by}-{value}-{part_name}"
+
+
+def write_partitions(dataframe, container, dataset_path, part_name="part-0", schema=None, split_by=None):
+
+    # one file per business date, date is kept in the path only. With split_by
+    # one file per date and value of that column, so shards never share a file
+    keys = Fields.date if split_by is None else [Fields.date, split_by]
+    groups = []
+    for key, df in dataframe.groupby(keys, sort=True, observed=True):
+        key = key if isinstance(key, tuple) else (key,)
+        name = part_name if split_by is None else split_part_name(split_by, key[1], part_name)
+        groups.append((key[0], name, df.drop(columns=Fields.date)))
+
+    with ThreadPoolExecutor(max_workers=Storage.max_workers) as executor:
+        list(executor.map(
+            bind(lambda g: write_parquet(
+                dataframe=g[2],
+                container=container,
+                file_path=partition_path(dataset_path, g[0], g[1]),
+                schema=schema,
+            )),
+            groups
+        ))
+
+    return sorted({date for date, _, _ in groups})
+
+
+def rewrite_partitions(container, dataset_path, dates, fn, schema=None):
+
+    # replace every file of the given partitions with fn applied to its rows
+    files, etags = list_partition_files(container, dataset_path, with_etags=True)
+    dates = set(pd.DatetimeIndex(dates))
+    files = {f: d for f, d in files.items() if d in dates}
+
+    def rewrite(f):
+        df = _read_partition_file(container, f, files[f], None, None, etags[f])
+        df = fn(df).drop(columns=Fields.date)
+        write_parquet(dataframe=df, container=container, file_path=f, schema=schema)
+
+    with ThreadPoolExecutor(max_workers=Storage.max_workers) as executor:
+        list(executor.map(bind(rewrite), files))
+
+    return sorted(set(files.values()))
+
+
+def delete_partitions(container, dataset_path, dates):
+
+    for d in dates:
+        prefix = partition_prefix(dataset_path, d)
+
+        # delete files before the directory entry itself
+        blobs = list_blob_files(container_name=container, blob_path=prefix.rstrip("/"))
+        blobs = [f for f in blobs if f.startswith(prefix) or f == prefix.rstrip("/")]
+        for f in sorted(blobs, key=len, reverse=True):
+            delete_blob_file(container_name=container, file_path=f)
+
+        if len(blobs) > 0:
+            logger.info(f"Deleted partition {prefix} from container {container}")
+
+
+def migrate_to_partitions(container, file_path, dataset_path, schema=None):
+
+    # one-off conversion of a legacy single-file dataset
+    if len(list_partition_files(container, dataset_path)) > 0:
+        return
+
+    try:
+        df = read_parquet(container=container, file_path=file_path)
+    except FileNotFoundError:
+        return
+
+    if df.shape[0] > 0:
+        write_partitions(df, container, dataset_path, schema=schema)
+        logger.info(f"Migrated {file_path} into partitioned dataset {dataset_path}")
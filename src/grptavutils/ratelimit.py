@@ -0,0 +1,49 @@
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Allows rate calls per second on average, in bursts of at most capacity calls."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+
+        # waits outside the lock, so other threads can refill and take their turn
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt, base_seconds, max_seconds):
+
+    # full jitter, concurrent callers failing together do not retry together
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
+
+
+def call_with_retries(fn, is_retryable, max_attempts, base_seconds=1.0, max_seconds=64.0, on_retry=None):
+    """Calls fn, retrying errors accepted by is_retryable with exponential backoff."""
+
+    for attempt in range(max_attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_attempts - 1 or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, base_seconds, max_seconds)
+            if on_retry is not None:
+                on_retry(e, delay)
+            time.sleep(delay)
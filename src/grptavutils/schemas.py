@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from grptavutils.constants import Fields
+from grptavutils.logs import logger
+
+# repeated strings are stored dictionary encoded
+category = pa.dictionary(pa.int32(), pa.string())
+
+
+class Schemas:
+
+    # bronze tables
+
+    ga = pa.schema([
+        (Fields.date, pa.timestamp("ns")),
+        (Fields.ga_source, category),
+        (Fields.ga_channel_grouping, category),
+        (Fields.ga_sessions, pa.int32()),
+        (Fields.ga_users, pa.int32()),
+    ])
+
+    # daily rollups of ga, by channel grouping and by date
+    ga_channels = pa.schema([
+        (Fields.date, pa.timestamp("ns")),
+        (Fields.ga_channel_grouping, category),
+        (Fields.ga_sessions, pa.int32()),
+        (Fields.ga_users, pa.int32()),
+    ])
+
+    ga_daily = pa.schema([
+        (Fields.date, pa.timestamp("ns")),
+        (Fields.ga_sessions, pa.int32()),
+        (Fields.ga_users, pa.int32()),
+    ])
+
+    oracle_employees = pa.schema([
+        (Fields.date, pa.timestamp("ns")),
+        (Fields.ora_location_id, pa.int16()),
+        (Fields.ora_rev_center_id, pa.int16()),
+        (Fields.ora_employee_id, pa.int32()),
+        (Fields.ora_menu_item_id, pa.int32()),
+        (Fields.ora_ora_rev_center_name, category),
+        (Fields.ora_employee_first_name, category),
+        (Fields.ora_employee_last_name, category),
+        (Fields.ora_menu_item_name, category),
+        (Fields.ora_menu_item_master_name, category),
+        (Fields.ora_major_group_name, category),
+        (Fields.ora_family_group_name, category),
+        (Fields.ora_sales_total, pa.float32()),
+        (Fields.ora_sales_count, pa.int16()),
+        (Fields.ora_sales_gross_before_discount, pa.float32()),
+        (Fields.ora_discount_total, pa.float32()),
+        (Fields.appetizers_flag, pa.int8()),
+        (Fields.bread_flag, pa.int8()),
+        (Fields.sides_flag, pa.int8()),
+        (Fields.wine_weighted_flag, pa.float32()),
+        (Fields.menu_flag, pa.int8()),
+        (Fields.menu_item_cost, pa.float32()),
+        (Fields.total_cost, pa.float32()),
+        (Fields.margin, pa.float32()),
+    ])
+
+    oracle_guests = pa.schema([
+        (Fields.date, pa.timestamp("ns")),
+        (Fields.ora_check_close_datetime, pa.timestamp("ns")),
+        (Fields.ora_check_open_datetime, pa.timestamp("ns")),
+        (Fields.ora_guest_check_id, pa.int64()),
+        (Fields.ora_employee_id, pa.int32()),
+        (Fields.ora_rev_center_id, pa.int16()),
+        (Fields.ora_location_id, pa.int16()),
+        (Fields.ora_order_type_id, pa.int16()),
+        (Fields.ora_num_guests, pa.int16()),
+        (Fields.ora_check_total, pa.float32()),
+        (Fields.ora_void_total, pa.float32()),
+        (Fields.ora_tip_total, pa.float32()),
+        (Fields.ora_error_correct_total, pa.float32()),
+        (Fields.ora_transfer_to_check_num, pa.int32()),
+        (Fields.ora_service_charge, pa.float32()),
+        (Fields.ora_discount_total, pa.float32()),
+        (Fields.ora_check_sub_total, pa.float32()),
+        (Fields.ora_check_duration, pa.int32()),
+        (Fields.ora_check_tot_items, pa.int16()),
+        (Fields.ora_error_correct_count, pa.int16()),
+        (Fields.ora_is_employee_meal, pa.int8()),
+        (Fields.ora_transfer_status_code, category),
+        (Fields.ora_transfer_status, category),
+        (Fields.ora_order_type_name, category),
+        (Fields.ora_guest_employee_first_name, category),
+        (Fields.ora_guest_employee_last_name, category),
+        (Fields.ora_table_reference, category),
+        (Fields.period_of_day, category),
+        (Fields.shift_id, category),
+        (Fields.hours_per_week, pa.float32()),
+        (Fields.productivity, pa.float32()),
+    ])
+
+    reservations = pa.schema([
+        (Fields.filename, category),
+        (Fields.date, pa.timestamp("ns")),
+        (Fields.shift_name, category),
+        (Fields.created_date, pa.timestamp("ns")),
+        (Fields.created_time, pa.timestamp("ns")),
+        (Fields.reservation_date, pa.timestamp("ns")),
+        (Fields.reservation_time, pa.string()),
+        (Fields.update_date, pa.timestamp("ns")),
+        (Fields.update_time, pa.timestamp("ns")),
+        (Fields.reservation_status, category),
+        (Fields.detailed_status, category),
+        (Fields.confirmation_id, pa.string()),
+        (Fields.booked_by, category),
+        (Fields.reservation_notes, pa.string()),
+        (Fields.booked_covers, pa.int16()),
+        (Fields.reservation_tag, category),
+        (Fields.client_notes, pa.string()),
+    ])
+
+    # dimensions
+
+    item_cost = pa.schema([
+        (Fields.ora_menu_item_id, pa.int32()),
+        (Fields.menu_item_cost, pa.float32()),
+    ])
+
+    employee_hours = pa.schema([
+        (Fields.ora_employee_id, pa.int32()),
+        (Fields.period_of_day, category),
+        (Fields.shift_id, pa.string()),
+        (Fields.hours_per_week, pa.float32()),
+    ])
+
+
+def _int_dtype(series, arrow_type):
+
+    dtype = arrow_type.to_pandas_dtype()
+    info = np.iinfo(dtype)
+
+    # widen instead of wrapping around when the declared width is too small
+    if series.notna().any() and (series.min() < info.min or series.max() > info.max):
+        logger.warning(f"Column {series.name} does not fit {arrow_type}, keeping it as int64")
+        dtype = np.int64
+
+    # nullable integers when values are missing
+    if series.isna().any():
+        return pd.api.types.pandas_dtype(np.dtype(dtype).name.capitalize())
+
+    return dtype
+
+
+def cast_frame(df_in, schema):
+    """Casts the columns of df_in declared in schema, other columns are left untouched."""
+
+    df = df_in.copy()
+    for field in schema:
+        if field.name not in df.columns:
+            continue
+
+        col = df[field.name]
+        if pa.types.is_dictionary(field.type):
+            df[field.name] = col.astype("category")
+        elif pa.types.is_string(field.type):
+            df[field.name] = col.astype(object)
+        elif pa.types.is_timestamp(field.type):
+            df[field.name] = pd.to_datetime(col)
+        elif pa.types.is_integer(field.type):
+            values = pd.to_numeric(col)
+            df[field.name] = values.astype(_int_dtype(values, field.type))
+        elif pa.types.is_floating(field.type):
+            df[field.name] = pd.to_numeric(col).astype(field.type.to_pandas_dtype())
+
+    return df
+
+
+def concat_frames(dfs):
+    """Concatenates frames keeping categorical columns categorical."""
+
+    df = pd.concat(dfs, ignore_index=True)
+    for col in df.columns:
+        parts = [d[col] for d in dfs if col in d.columns]
+        if len(parts) == len(dfs) and all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+            try:
+                df[col] = pd.api.types.union_categoricals(parts, ignore_order=True)
+            except TypeError:
+                continue
+
+    return df
+
+
+def csv_column_types(ren_cols, schema):
+    """Arrow types to parse raw csv columns with, named as in the source file.
+
+    Numbers are parsed at full width and narrowed later by cast_frame.
+    """
+
+    column_types = {}
+    for raw_col, col in ren_cols.items():
+        if col not in schema.names:
+            continue
+
+        arrow_type = schema.field(col).type
+        if pa.types.is_integer(arrow_type):
+            arrow_type = pa.int64()
+        elif pa.types.is_floating(arrow_type):
+            arrow_type = pa.float64()
+        elif pa.types.is_timestamp(arrow_type):
+            arrow_type = pa.timestamp("s")
+        column_types[raw_col] = arrow_type
+
+    return column_types
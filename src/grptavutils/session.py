@@ -0,0 +1,294 @@
+import datetime
+import json
+import os
+import threading
+import uuid
+import fsspec
+import requests
+from grptavutils.constants import Storage
+from grptavutils.metrics import CountingFile, add
+
+
+class StorageSession:
+    """Process-wide access to the Azure storage account.
+
+    Credentials are loaded once, blob calls share one pooled HTTP session and
+    one abfs filesystem is kept per container. Azure libraries are imported
+    on first use so the other backends run without them.
+    """
+
+    def __init__(self, creds_path=Storage.creds_path, max_connections=Storage.max_connections):
+
+        # get azure access credentials
+        with open(creds_path, "r") as f:
+            self.storage_options = json.load(f)
+        self._init_clients(self.storage_options["connection_string"], max_connections)
+
+    def _init_clients(self, connection_string, max_connections):
+        self.connection_string = connection_string
+        self.max_connections = max_connections
+
+        self._lock = threading.Lock()
+        self._service_client = None
+        self._container_clients = {}
+        self._filesystems = {}
+
+    def __getstate__(self):
+        # clients are not shared with worker processes, they open their own
+        return {
+            "storage_options": self.storage_options,
+            "connection_string": self.connection_string,
+            "max_connections": self.max_connections,
+        }
+
+    def __setstate__(self, state):
+        self.storage_options = state["storage_options"]
+        self._init_clients(state["connection_string"], state["max_connections"])
+
+    @property
+    def service_client(self):
+        from azure.core.pipeline.transport import RequestsTransport
+        from azure.storage.blob import BlobServiceClient
+
+        with self._lock:
+            if self._service_client is None:
+
+                # pooled http connections shared by every blob call
+                http_session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=self.max_connections,
+                    pool_maxsize=self.max_connections,
+                )
+                http_session.mount("https://", adapter)
+                http_session.mount("http://", adapter)
+
+                self._service_client = BlobServiceClient.from_connection_string(
+                    self.connection_string,
+                    transport=RequestsTransport(session=http_session, session_owner=False),
+                )
+
+            return self._service_client
+
+    def container_client(self, container):
+        service_client = self.service_client
+        with self._lock:
+            if container not in self._container_clients:
+                self._container_clients[container] = service_client.get_container_client(container)
+
+            return self._container_clients[container]
+
+    def filesystem(self, container):
+        from adlfs import AzureBlobFileSystem
+
+        with self._lock:
+            if container not in self._filesystems:
+                self._filesystems[container] = AzureBlobFileSystem(**self.storage_options)
+
+            return self._filesystems[container]
+
+    def path(self, container, file_path):
+        return f"{container}/{file_path}"
+
+    def open(self, container, file_path, mode="rb"):
+        f = self.filesystem(container).open(self.path(container, file_path), mode)
+
+        # bytes moved through the handle are reported to the running step
+        return CountingFile(f)
+
+    def list_blobs(self, container, blob_path):
+        container_client = self.container_client(container)
+
+        blobs = []
+        for b in container_client.list_blobs(name_starts_with=blob_path):
+            blobs.append({
+                "name": b["name"],
+                "etag": b["etag"],
+                "last_modified": b["last_modified"],
+                "size": b["size"],
+            })
+
+        return blobs
+
+    def delete_blob(self, container, file_path):
+        self.container_client(container).delete_blob(file_path, snapshot=None)
+
+    def blob_properties(self, container, file_path):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        blob_client = self.container_client(container).get_blob_client(file_path)
+        try:
+            props = blob_client.get_blob_properties()
+        except ResourceNotFoundError:
+            raise FileNotFoundError(f"{file_path} not found in container {container}")
+
+        return {
+            "name": file_path,
+            "etag": props.etag,
+            "last_modified": props.last_modified,
+            "size": props.size,
+        }
+
+    def download(self, container, file_path):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            downloader = self.container_client(container).download_blob(
+                file_path, max_concurrency=Storage.transfer_concurrency
+            )
+            data = downloader.readall()
+        except ResourceNotFoundError:
+            raise FileNotFoundError(f"{file_path} not found in container {container}")
+        add(bytes_read=len(data))
+
+        return data, downloader.properties.etag
+
+    def upload(self, container, file_path, data):
+        result = self.container_client(container).upload_blob(
+            file_path, data, overwrite=True, max_concurrency=Storage.transfer_concurrency
+        )
+        add(bytes_written=len(data))
+
+        return result["etag"]
+
+
+class AzuriteStorageSession(StorageSession):
+    """Azurite storage emulator, containers are created on first use."""
+
+    def __init__(self, connection_string=Storage.azurite_connection_string, max_connections=Storage.max_connections):
+        self.storage_options = {"connection_string": connection_string}
+        self._init_clients(connection_string, max_connections)
+
+    def container_client(self, container):
+        from azure.core.exceptions import ResourceExistsError
+
+        created = container in self._container_clients
+        container_client = super().container_client(container)
+        if not created:
+            try:
+                container_client.create_container()
+            except ResourceExistsError:
+                pass
+
+        return container_client
+
+
+class LocalStorageSession:
+    """Storage account backed by a local directory, one folder per container."""
+
+    def __init__(self, root=Storage.local_root):
+        self.root = root
+        self._filesystem = fsspec.filesystem("file", auto_mkdir=True)
+
+    def filesystem(self, container):
+        return self._filesystem
+
+    def path(self, container, file_path):
+        return os.path.join(self.root, container, file_path)
+
+    def open(self, container, file_path, mode="rb"):
+        f = self._filesystem.open(self.path(container, file_path), mode)
+
+        return CountingFile(f)
+
+    def _properties(self, container, file_path):
+        stat = os.stat(self.path(container, file_path))
+
+        return {
+            "name": file_path,
+            "etag": f"{stat.st_mtime_ns:x}-{stat.st_size:x}",
+            "last_modified": datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc),
+            "size": stat.st_size,
+        }
+
+    def list_blobs(self, container, blob_path):
+        base = os.path.join(self.root, container)
+
+        # from the directory of the prefix, blobs elsewhere cannot match it
+        start = os.path.join(base, os.path.dirname(blob_path))
+
+        blobs = []
+        for dirpath, _, filenames in os.walk(start):
+            for fn in filenames:
+                # uploads in progress
+                if fn.endswith(".tmp"):
+                    continue
+                name = os.path.relpath(os.path.join(dirpath, fn), base).replace(os.sep, "/")
+                if name.startswith(blob_path):
+                    blobs.append(self._properties(container, name))
+
+        return sorted(blobs, key=lambda b: b["name"])
+
+    def delete_blob(self, container, file_path):
+        path = self.path(container, file_path)
+        if os.path.isdir(path):
+            os.rmdir(path)
+        else:
+            os.remove(path)
+
+    def blob_properties(self, container, file_path):
+        if not os.path.isfile(self.path(container, file_path)):
+            raise FileNotFoundError(f"{file_path} not found in container {container}")
+
+        return self._properties(container, file_path)
+
+    def download(self, container, file_path):
+        try:
+            with open(self.path(container, file_path), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"{file_path} not found in container {container}")
+        add(bytes_read=len(data))
+
+        return data, self._properties(container, file_path)["etag"]
+
+    def upload(self, container, file_path, data):
+        path = self.path(container, file_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write aside and move in place so readers never see partial files
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        add(bytes_written=len(data))
+
+        return self._properties(container, file_path)["etag"]
+
+
+def make_session(backend=None):
+    """Session of the configured backend: azure (default), azurite or local."""
+
+    if backend is None:
+        backend = os.environ.get(Storage.backend_env, Storage.backend)
+
+    if backend == "azure":
+        return StorageSession()
+    if backend == "azurite":
+        return AzuriteStorageSession(
+            os.environ.get(Storage.azurite_connection_string_env, Storage.azurite_connection_string)
+        )
+    if backend == "local":
+        return LocalStorageSession(os.environ.get(Storage.local_root_env, Storage.local_root))
+
+    raise ValueError(f"Unknown storage backend {backend}, expected azure, azurite or local")
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+
+        return _session
+
+
+def set_session(session):
+    global _session
+
+    with _session_lock:
+        _session = session
@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from grptavutils.constants import Storage
+from grptavutils.metrics import add_usage, counted, patch_phases, phases_to_time
+from grptavutils.session import get_session, set_session
+
+
+def file_shards(blobs, shard_bytes=None):
+    """Names of consecutive staging files, in chunks of at most shard_bytes.
+
+    A file larger than shard_bytes is a chunk of its own. The size is read from
+    GRPTAV_SHARD_BYTES when not given, it bounds the memory of each shard.
+    """
+
+    if shard_bytes is None:
+        shard_bytes = int(os.environ.get(Storage.shard_bytes_env, Storage.shard_bytes))
+
+    # staging exports are one file per day, consecutive files make a date range
+    shards = []
+    size = 0
+    for b in sorted(blobs, key=lambda b: b["name"]):
+        if len(shards) == 0 or size + b["size"] > shard_bytes:
+            shards.append([])
+            size = 0
+        shards[-1].append(b["name"])
+        size += b["size"]
+
+    return shards
+
+
+def shard_name(files):
+
+    # part file name of a shard, after its first staging file
+    return "part-" + files[0].rsplit("/", 1)[-1].rsplit(".", 1)[0]
+
+
+def worth_pool(size, rows):
+    """Whether a shard of size staging bytes and rows rows is worth spreading over processes.
+
+    The thresholds are read from GRPTAV_POOL_BYTES and GRPTAV_POOL_ROWS.
+    """
+
+    pool_bytes = int(os.environ.get(Storage.pool_bytes_env, Storage.pool_bytes))
+    pool_rows = int(os.environ.get(Storage.pool_rows_env, Storage.pool_rows))
+
+    return size > pool_bytes or rows > pool_rows
+
+
+def init_worker(session, phases):
+
+    # storage session of the parent, and the functions it times if any
+    set_session(session)
+    patch_phases(phases)
+
+
+def map_shards(fn, shards, max_processes=Storage.max_processes):
+    """Yields fn(shard) for every shard, in shard order, as soon as it is done.
+
+    Shards run in worker processes that open their own storage session, a single
+    shard or cpu runs them one at a time in the calling process. fn must be a
+    module level function.
+    """
+
+    max_processes = min(max_processes, len(shards), os.cpu_count() or 1)
+    if max_processes <= 1:
+        for s in shards:
+            yield fn(s)
+        return
+
+    # spawned, forking a process that runs steps in threads is not safe
+    with ProcessPoolExecutor(
+        max_workers=max_processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(get_session(), phases_to_time()),
+    ) as executor:
+        futures = [executor.submit(counted, fn, s) for s in shards]
+        for f in futures:
+            result, usage = f.result()
+            add_usage(usage)
+            yield result
+
+
+def map_groups(fn, df, by, shard, max_processes=Storage.max_processes):
+    """Yields fn(shard) for every group of df rows sharing a value of column by.
+
+    For a single shard, e.g. the daily staging file: parsed once, then its
+    groups handed to the worker processes as shard["df"], in value order.
+    """
+
+    groups = [{**shard, "df": g} for _, g in df.groupby(by, sort=True, observed=True)]
+
+    return map_shards(fn, groups, max_processes)
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+from grptavutils.constants import Fields
+
+# item columns the rules look at
+ITEM_COLUMNS = [Fields.ora_major_group_name, Fields.ora_family_group_name, Fields.ora_menu_item_name]
+
+# (flag, value, conditions), a condition is (column, test, patterns) and holds when
+# the lowercased column passes the test for any of the patterns. The first rule of a
+# flag whose conditions all hold gives the value, items matching none get 0.
+FLAG_RULES = [
+    (Fields.appetizers_flag, 1, [
+        (Fields.ora_family_group_name, "startswith", ["aperitivi"]),
+    ]),
+    (Fields.bread_flag, 1, [
+        (Fields.ora_family_group_name, "equals", ["pane"]),
+    ]),
+    (Fields.sides_flag, 1, [
+        (Fields.ora_family_group_name, "startswith", ["contorni"]),
+    ]),
+    (Fields.wine_weighted_flag, .25, [
+        (Fields.ora_major_group_name, "startswith", ["beverage"]),
+        (Fields.ora_family_group_name, "startswith", ["vin", "bollicin"]),
+        (Fields.ora_family_group_name, "contains", ["calic"]),
+    ]),
+    (Fields.wine_weighted_flag, 1, [
+        (Fields.ora_major_group_name, "startswith", ["beverage"]),
+        (Fields.ora_family_group_name, "startswith", ["vin", "bollicin"]),
+    ]),
+    (Fields.menu_flag, 1, [
+        (Fields.ora_menu_item_name, "contains", ["menu guida"]),
+    ]),
+]
+
+FLAGS = list(dict.fromkeys(flag for flag, _, _ in FLAG_RULES))
+
+
+def _test(values, test, pattern):
+    if test == "equals":
+        return values == pattern
+    if test == "startswith":
+        return values.str.startswith(pattern)
+    if test == "contains":
+        return values.str.contains(pattern, regex=False)
+
+    raise ValueError(f"Unknown flag rule test {test}")
+
+
+def item_descriptions(df_in):
+    """Distinct item descriptions in order of first appearance."""
+
+    return df_in[[Fields.ora_menu_item_id] + ITEM_COLUMNS].drop_duplicates().reset_index(drop=True)
+
+
+def classify_items(df_in):
+    """Flags of every menu_item_id in df_in, indexed by menu_item_id.
+
+    Rules run once per distinct item description. An item gets the value of its
+    first description, in row order, matching a rule of the flag.
+    """
+
+    items = item_descriptions(df_in)
+    lowered = {c: items[c].astype(str).str.lower() for c in ITEM_COLUMNS}
+
+    flags = pd.DataFrame(index=pd.Index(items[Fields.ora_menu_item_id].unique(), name=Fields.ora_menu_item_id))
+    for flag in FLAGS:
+
+        # value of the first matching rule for each description
+        value = pd.Series(np.nan, index=items.index)
+        for rule_flag, rule_value, conditions in FLAG_RULES:
+            if rule_flag != flag:
+                continue
+            mask = pd.Series(True, index=items.index)
+            for column, test, patterns in conditions:
+                any_pattern = pd.Series(False, index=items.index)
+                for p in patterns:
+                    any_pattern |= _test(lowered[column], test, p).fillna(False)
+                mask &= any_pattern
+            value = value.where(value.notna() | ~mask, rule_value)
+
+        # first matching description of each item
+        matched = value.notna()
+        first = (
+            pd.DataFrame({Fields.ora_menu_item_id: items.loc[matched, Fields.ora_menu_item_id], flag: value[matched]})
+            .drop_duplicates(subset=Fields.ora_menu_item_id)
+            .set_index(Fields.ora_menu_item_id)[flag]
+        )
+        flags[flag] = first.reindex(flags.index).fillna(0)
+
+    return flags
+
+
+def apply_flags(df_in, flags):
+    """Broadcasts item flags onto every row with one lookup, unknown items get 0."""
+
+    positions = flags.index.get_indexer(df_in[Fields.ora_menu_item_id])
+
+    # position -1 of unknown items picks the trailing row of zeros
+    values = np.vstack([flags.to_numpy(dtype="float64"), np.zeros((1, flags.shape[1]))])[positions]
+
+    df = df_in.copy()
+    for i, flag in enumerate(flags.columns):
+        df[flag] = values[:, i]
+
+    return df
+
+
+def flag_items(df_in):
+    return apply_flags(df_in, classify_items(df_in))
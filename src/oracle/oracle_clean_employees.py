@@ -1,60 +1,30 @@
+import numpy as np
 import pandas as pd
-from grptavutils import list_blob_files, read_parquet, read_csv, write_parquet, delete_blob_file, delete_staging_files, read_excel
+from grptavutils import read_staging_tables, read_parquet, write_parquet, list_blob_properties
 from grptavutils.constants import Fields, Storage
+from grptavutils.dimensions import read_dimension
+from grptavutils.manifest import read_manifest, new_staging_files, staging_row_counts, update_manifest
+from grptavutils.normalise import normalise
+from grptavutils.partitions import (
+    list_partition_dates, migrate_to_partitions, read_dataset, rewrite_partitions, write_partitions
+)
+from grptavutils.schemas import Schemas, cast_frame, csv_column_types
+from grptavutils.shards import file_shards, map_groups, map_shards, shard_name, worth_pool
 from grptavutils.logs import logger
+from oracle.item_flags import FLAGS, ITEM_COLUMNS, apply_flags, classify_items, item_descriptions
 
 
-def read_bronze():
-    try:
-        df = read_parquet(Storage.bronze, Storage.bronze_oracle_employees)
-
-        # drop flags
-        for col in ["wine_weighted_flag", "bread_flag", "sides_flag", "appetizers_flag", "menu_flag"]:
-            try:
-                df.drop(columns=[col], inplace=True)
-            except KeyError:
-                continue
+def read_bronze_dates():
+    migrate_to_partitions(
+        Storage.bronze, Storage.legacy_bronze_oracle_employees, Storage.bronze_oracle_employees,
+        schema=Schemas.oracle_employees,
+    )
+    dates = list_partition_dates(Storage.bronze, Storage.bronze_oracle_employees)
 
-        return df
+    return dates
 
-    except FileNotFoundError:
-        empty_df = pd.DataFrame(columns=[
-            Fields.filename,
-            Fields.date,
-            Fields.ora_location_id,
-            Fields.ora_rev_center_id,
-            Fields.ora_employee_id,
-            Fields.ora_menu_item_id,
-            Fields.ora_ora_rev_center_name,
-            Fields.ora_employee_first_name,
-            Fields.ora_employee_last_name,
-            Fields.ora_menu_item_name,
-            Fields.ora_menu_item_master_name,
-            Fields.ora_major_group_name,
-            Fields.ora_family_group_name,
-            Fields.ora_sales_total,
-            Fields.ora_sales_count,
-            Fields.ora_sales_gross_before_discount,
-            Fields.ora_discount_total,
-            Fields.menu_item_cost,
-        ])
-
-        return empty_df
-
-
-def read_staging():
-    files = list_blob_files(container_name=Storage.staging, blob_path="oracle/Employee")
-
-    # iterate over files
-    df = pd.DataFrame()
-    for f in files:
-        try:
-            current_df = read_csv(container=Storage.staging, file_path=f, sep=";", decimal=".")
-            current_df.loc[:, Fields.filename] = f
-            df = pd.concat([df, current_df])
-        except pd.errors.EmptyDataError:
-            delete_blob_file(container_name=Storage.staging, file_path=f)
 
+def read_staging(files):
     # rename columns
     ren_cols = {
         Fields.filename: Fields.filename,
@@ -75,213 +45,341 @@ def read_staging():
         "grossSalesBeforeDiscount": Fields.ora_sales_gross_before_discount,
         "discountTotal": Fields.ora_discount_total,
     }
-    df = df.rename(columns=ren_cols)
+
+    # parse only the mapped columns, typed as in the bronze schema
+    table = read_staging_tables(
+        container=Storage.staging,
+        files=files,
+        sep=";",
+        include_columns=[c for c in ren_cols if c != Fields.filename],
+        column_types=csv_column_types(ren_cols, Schemas.oracle_employees),
+        timestamp_parsers=["%Y-%m-%d"],
+    )
+    table = table.rename_columns([ren_cols.get(c, c) for c in table.column_names])
 
     # select
     sel = list(ren_cols.values())
-    df = df[sel]
-
-    # data types
-    df[Fields.date] = pd.to_datetime(df[Fields.date], format="%Y-%m-%d")
-    df[Fields.ora_location_id] = df[Fields.ora_location_id].astype("int", errors="ignore")
-    df[Fields.ora_rev_center_id] = df[Fields.ora_rev_center_id].astype("int", errors="ignore")
-    df[Fields.ora_employee_id] = df[Fields.ora_employee_id].astype("int", errors="ignore")
-    df[Fields.ora_menu_item_id] = df[Fields.ora_menu_item_id].astype("int", errors="ignore")
-    df[Fields.ora_sales_total] = df[Fields.ora_sales_total].astype("double", errors="ignore")
-    df[Fields.ora_sales_count] = df[Fields.ora_sales_count].astype("int", errors="ignore")
-    df[Fields.ora_sales_gross_before_discount] = df[Fields.ora_sales_gross_before_discount].astype("double",
-                                                                                                   errors="ignore")
-    df[Fields.ora_discount_total] = df[Fields.ora_discount_total].astype("double", errors="ignore")
-
-    # initcap
-    df[Fields.ora_ora_rev_center_name] = df[Fields.ora_ora_rev_center_name].str.capitalize()
-    df[Fields.ora_employee_first_name] = df[Fields.ora_employee_first_name].str.capitalize()
-    df[Fields.ora_employee_last_name] = df[Fields.ora_employee_last_name].str.capitalize()
-    df[Fields.ora_menu_item_name] = df[Fields.ora_menu_item_name].fillna(Fields.missing)
-    df[Fields.ora_menu_item_master_name] = df[Fields.ora_menu_item_master_name].str.capitalize()
-    df[Fields.ora_major_group_name] = df[Fields.ora_major_group_name].str.capitalize()
-    df[Fields.ora_family_group_name] = df[Fields.ora_family_group_name].str.capitalize()
-
-    # fill missing
-    df[Fields.ora_ora_rev_center_name] = df[Fields.ora_ora_rev_center_name].fillna(Fields.missing)
-    df[Fields.ora_employee_first_name] = df[Fields.ora_employee_first_name].fillna(Fields.missing)
-    df[Fields.ora_employee_last_name] = df[Fields.ora_employee_last_name].fillna(Fields.missing)
-    df[Fields.ora_menu_item_name] = df[Fields.ora_menu_item_name].fillna(Fields.missing)
-    df[Fields.ora_menu_item_master_name] = df[Fields.ora_menu_item_master_name].fillna(Fields.missing)
-    df[Fields.ora_major_group_name] = df[Fields.ora_major_group_name].fillna(Fields.missing)
-    df[Fields.ora_family_group_name] = df[Fields.ora_family_group_name].fillna(Fields.missing)
-    df[Fields.ora_location_id] = df[Fields.ora_location_id].fillna(0)
-    df[Fields.ora_rev_center_id] = df[Fields.ora_rev_center_id].fillna(0)
-    df[Fields.ora_employee_id] = df[Fields.ora_employee_id].fillna(0)
-    df[Fields.ora_menu_item_id] = df[Fields.ora_menu_item_id].fillna(0)
-    df[Fields.ora_sales_total] = df[Fields.ora_sales_total].fillna(0)
-    df[Fields.ora_sales_count] = df[Fields.ora_sales_count].fillna(0)
-    df[Fields.ora_sales_gross_before_discount] = df[Fields.ora_sales_gross_before_discount].fillna(0)
-    df[Fields.ora_discount_total] = df[Fields.ora_discount_total].fillna(0)
+    df = table.select(sel).to_pandas()
+
+    # initcap and fill missing, once per distinct value
+    df = normalise(df, {
+        Fields.ora_ora_rev_center_name: {"capitalize": True, "fillna": Fields.missing},
+        Fields.ora_employee_first_name: {"capitalize": True, "fillna": Fields.missing},
+        Fields.ora_employee_last_name: {"capitalize": True, "fillna": Fields.missing},
+        Fields.ora_menu_item_name: {"fillna": Fields.missing},
+        Fields.ora_menu_item_master_name: {"capitalize": True, "fillna": Fields.missing},
+        Fields.ora_major_group_name: {"capitalize": True, "fillna": Fields.missing},
+        Fields.ora_family_group_name: {"capitalize": True, "fillna": Fields.missing},
+        Fields.ora_location_id: {"fillna": 0},
+        Fields.ora_rev_center_id: {"fillna": 0},
+        Fields.ora_employee_id: {"fillna": 0},
+        Fields.ora_menu_item_id: {"fillna": 0},
+        Fields.ora_sales_total: {"fillna": 0},
+        Fields.ora_sales_count: {"fillna": 0},
+        Fields.ora_sales_gross_before_discount: {"fillna": 0},
+        Fields.ora_discount_total: {"fillna": 0},
+    })
+
+    # compact types
+    df = cast_frame(df, Schemas.oracle_employees)
 
     return df
 
 
-def trunc_staging(bronze_df, staging_df):
-    dates = bronze_df[Fields.date].unique()
-    mask = staging_df[Fields.date].isin(dates)
+def trunc_staging(bronze_dates, staging_df):
+    mask = staging_df[Fields.date].isin(bronze_dates)
     trunc_df = staging_df[~mask]
 
     return trunc_df
 
 
-def flag_wines(df_in: pd.DataFrame) -> pd.DataFrame:
-    # identify wines
-    mask = df_in["major_group_name"].str.lower().str.startswith("beverage") & (
-            df_in["family_group_name"].str.lower().str.startswith("vin") | df_in[
-        "family_group_name"].str.lower().str.startswith("bollicin")
-    )
-    wines_df = df_in.loc[mask, ["menu_item_id", "family_group_name"]]
-    wines_df = wines_df.drop_duplicates(subset="menu_item_id")
-
-    # identify glasses
-    glass_mask = (df_in["family_group_name"].str.lower().str.contains("calic"))
+def convert_item_cost(df_in):
 
-    # make weight
-    wines_df["wine_weighted_flag"] = 1
-    wines_df.loc[glass_mask, "wine_weighted_flag"] = .25
+    df = df_in[[Fields.ora_menu_item_id, Fields.menu_item_cost]]
 
-    wines_df.drop(columns="family_group_name", inplace=True)
-    df = df_in.merge(wines_df, on="menu_item_id", how="left")
-    df["wine_weighted_flag"] = df["wine_weighted_flag"].fillna(0)
+    # ensure no duplicates
+    df = df.drop_duplicates(subset=[Fields.ora_menu_item_id])
 
     return df
 
 
-def flag_bread(df_in: pd.DataFrame) -> pd.DataFrame:
-    # identify bread
-    mask = df_in["family_group_name"].str.lower() == "pane"
-    bread_df = df_in.loc[mask, ["menu_item_id"]]
-    bread_df = bread_df.drop_duplicates(subset="menu_item_id")
+def read_item_cost():
+
+    # excel is parsed only when a new version is uploaded
+    df = read_dimension("item_cost", Storage.item_cost, convert_item_cost, schema=Schemas.item_cost)
+
+    return df.set_index(Fields.ora_menu_item_id)[Fields.menu_item_cost]
+
 
-    # make weight
-    bread_df["bread_flag"] = 1
+def calc_margin(df_in, item_cost):
 
-    # merge back
-    df = df_in.merge(bread_df, on="menu_item_id", how="left")
-    df["bread_flag"] = df["bread_flag"].fillna(0)
+    # cost of each row's item with one indexed lookup
+    df = df_in.copy()
+    df[Fields.menu_item_cost] = item_cost.reindex(df[Fields.ora_menu_item_id]).to_numpy()
+    df[Fields.total_cost] = df[Fields.ora_sales_count] * df[Fields.menu_item_cost]
+    df[Fields.margin] = df[Fields.ora_sales_total] - df[Fields.total_cost]
 
     return df
 
 
-def flag_sides(df_in: pd.DataFrame) -> pd.DataFrame:
-    # identify sides
-    mask = df_in["family_group_name"].str.lower().str.startswith("contorni")
-    sides_df = df_in.loc[mask, ["menu_item_id"]]
-    sides_df = sides_df.drop_duplicates(subset="menu_item_id")
+def make_item_state(descriptions, item_cost):
 
-    # make weight
-    sides_df["sides_flag"] = 1
+    # flags and cost of every item seen so far, indexed by menu_item_id
+    state = classify_items(descriptions)
+    state[Fields.menu_item_cost] = item_cost.reindex(state.index).astype("float64")
 
-    # merge back
-    df = df_in.merge(sides_df, on="menu_item_id", how="left")
-    df["sides_flag"] = df["sides_flag"].fillna(0)
+    return state
+
+
+def apply_item_state(df_in, state):
+    df = apply_flags(df_in, state[FLAGS])
+    df = calc_margin(df, state[Fields.menu_item_cost])
 
     return df
 
 
-def flag_appetizers(df_in: pd.DataFrame) -> pd.DataFrame:
-    # identify appetizers
-    mask = df_in["family_group_name"].str.lower().str.startswith("aperitivi")
-    sides_df = df_in.loc[mask, ["menu_item_id"]]
-    sides_df = sides_df.drop_duplicates(subset="menu_item_id")
+def read_item_state():
+    try:
+        descriptions = read_parquet(Storage.bronze, Storage.bronze_oracle_item_descriptions)
+        state = read_parquet(Storage.bronze, Storage.bronze_oracle_item_state)
+        return descriptions, state.set_index(Fields.ora_menu_item_id)
 
-    # make weight
-    sides_df["appetizers_flag"] = 1
+    except FileNotFoundError:
+        return None, None
 
-    # merge back
-    df = df_in.merge(sides_df, on="menu_item_id", how="left")
-    df["appetizers_flag"] = df["appetizers_flag"].fillna(0)
 
-    return df
+def merge_item_dates(item_dates, df):
 
+    # distinct (menu_item_id, date) pairs of the bronze rows
+    df = pd.concat([item_dates, df[[Fields.ora_menu_item_id, Fields.date]]], ignore_index=True)
+    df = df.drop_duplicates().astype({Fields.ora_menu_item_id: "int64", Fields.date: "datetime64[ns]"})
 
-def flag_menus(df_in: pd.DataFrame) -> pd.DataFrame:
-    # identify menus
-    mask = df_in["menu_item_name"].str.lower().str.contains("menu guida")
-    sides_df = df_in.loc[mask, ["menu_item_id"]]
-    sides_df = sides_df.drop_duplicates(subset="menu_item_id")
+    return df.sort_values([Fields.ora_menu_item_id, Fields.date]).reset_index(drop=True)
 
-    # make weight
-    sides_df["menu_flag"] = 1
 
-    # merge back
-    df = df_in.merge(sides_df, on="menu_item_id", how="left")
-    df["menu_flag"] = df["menu_flag"].fillna(0)
+def read_item_dates(bronze_dates):
 
-    return df
+    # business dates of every item, so a changed item opens only its own partitions
+    try:
+        item_dates = read_parquet(Storage.bronze, Storage.bronze_oracle_item_dates)
+    except FileNotFoundError:
+        item_dates = pd.DataFrame({
+            Fields.ora_menu_item_id: pd.Series(dtype="int64"),
+            Fields.date: pd.Series(dtype="datetime64[ns]"),
+        })
 
+    # partitions missing from it, all of them the first time
+    missing = sorted(set(bronze_dates) - set(pd.DatetimeIndex(item_dates[Fields.date].unique())))
+    if len(missing) > 0:
+        logger.info(f"Adding {len(missing)} business dates to the item dates")
+        df = read_dataset(
+            Storage.bronze, Storage.bronze_oracle_employees,
+            columns=[Fields.ora_menu_item_id, Fields.date], dates=missing,
+        )
+        item_dates = merge_item_dates(item_dates, df)
 
-def read_item_cost():
+    return item_dates
 
-    df = read_excel(Storage.bronze, Storage.item_cost)
-    df = df.drop(columns=[Fields.ora_family_group_name, Fields.ora_menu_item_name])
 
-    # ensure no duplicates
-    df = df.drop_duplicates(subset=[Fields.ora_menu_item_id])
+def write_item_state(descriptions, state, item_dates):
+    write_parquet(descriptions, Storage.bronze, Storage.bronze_oracle_item_descriptions)
+    write_parquet(state.reset_index(), Storage.bronze, Storage.bronze_oracle_item_state)
+    write_parquet(item_dates, Storage.bronze, Storage.bronze_oracle_item_dates)
 
-    return df
 
+def _differs(old, new):
+    return ~np.isclose(old.to_numpy(dtype="float64"), new.to_numpy(dtype="float64"), equal_nan=True)
 
-def calc_margin(df_in):
 
-    # read productivity data and make key
-    item_df = read_item_cost()
-    item_df = item_df[[Fields.ora_menu_item_id, Fields.menu_item_cost]]
+def changed_dates(used_states, new_state, item_dates):
+    """Business dates holding items whose flags or cost differ from the ones their rows were written with.
 
-    # join and calculate margin
-    df = (
-        df_in
-        .drop(columns=[Fields.menu_item_cost])
-        .merge(item_df, on=Fields.ora_menu_item_id, how="left")
-    )
-    df[Fields.total_cost] = df[Fields.ora_sales_count] * df[Fields.menu_item_cost]
-    df[Fields.margin] = df[Fields.ora_sales_total] - df[Fields.total_cost]
+    used_states are the item states rows were written with, None when unknown.
+    item_dates are the business dates of every item.
+    """
 
-    return df
+    if used_states is not None:
+        changed = set()
+        for used in used_states:
 
+            # columns of a flag rule added since count as changed
+            used = used.reindex(columns=new_state.columns)
+            differs = _differs(used, new_state.reindex(used.index)).any(axis=1)
+            changed.update(used.index[differs].tolist())
+        if len(changed) == 0:
+            return pd.DatetimeIndex([])
 
-def main():
-    # read bronze
-    bronze_df = read_bronze()
+        mask = item_dates[Fields.ora_menu_item_id].isin(changed)
+        logger.info(f"Flags or cost changed for {len(changed)} items")
+
+        return pd.DatetimeIndex(item_dates.loc[mask, Fields.date].unique())
+
+    # first run without a state, compare every bronze row once
+    cols = [Fields.ora_menu_item_id] + FLAGS + [Fields.menu_item_cost]
+    df = read_dataset(Storage.bronze, Storage.bronze_oracle_employees, columns=[Fields.date] + cols)
+    expected = new_state.reindex(df[Fields.ora_menu_item_id])
+    changed = _differs(df[cols[1:]], expected).any(axis=1)
 
-    # read staging
-    staging_df = read_staging()
+    return pd.DatetimeIndex(df.loc[changed, Fields.date].unique())
+
+
+def read_shard(shard):
+
+    staging_df = read_staging(files=shard["files"])
 
     # drop form staging already available data
-    trunc_df = trunc_staging(bronze_df=bronze_df, staging_df=staging_df)
-
-    # append to bronze
-    df = pd.concat([
-        bronze_df,
-        trunc_df.drop(columns=Fields.filename)
-    ])
-
-    # flag group of items
-    df = flag_appetizers(df)
-    df = flag_bread(df)
-    df = flag_sides(df)
-    df = flag_wines(df)
-    df = flag_menus(df)
-
-    # margin
-    df = calc_margin(df)
-
-    # write
-    write_parquet(
+    trunc_df = trunc_staging(bronze_dates=shard["bronze_dates"], staging_df=staging_df)
+    df = trunc_df.drop(columns=Fields.filename)
+
+    # flags and cost of the shard's items, items new to this shard are reconciled afterwards
+    descriptions = item_descriptions(df)
+    state = make_item_state(
+        item_descriptions(pd.concat([shard["descriptions"], descriptions], ignore_index=True)),
+        shard["item_cost"],
+    )
+    state = state.reindex(descriptions[Fields.ora_menu_item_id].unique())
+
+    return staging_row_counts(staging_df), df, descriptions, state
+
+
+def write_shard(shard):
+
+    # flag group of items and margin
+    df = apply_item_state(shard["df"], shard["state"])
+
+    # write new business dates only
+    write_partitions(
         dataframe=df,
         container=Storage.bronze,
-        file_path=Storage.bronze_oracle_employees,
+        dataset_path=Storage.bronze_oracle_employees,
+        part_name=shard["name"],
+        schema=Schemas.oracle_employees,
+        split_by=Fields.ora_location_id,
     )
 
-    # delete files from blob
-    files = list(staging_df[Fields.filename].unique())
-    # delete_staging_files(files)
+
+def clean_shard(shard):
+    """Cleans the staging files of one shard, one bronze file per location and business date.
+
+    Returns the rows read from each staging file, the item descriptions, the
+    item state the shard's rows were written with and the business dates of
+    its items.
+    """
+
+    row_counts, df, descriptions, state = read_shard(shard)
+    write_shard({"name": shard["name"], "df": df, "state": state})
+
+    return row_counts, descriptions, state, df[[Fields.ora_menu_item_id, Fields.date]].drop_duplicates()
+
+
+def clean_locations(shard):
+    """Cleans a single shard, its locations flagged and written in parallel processes.
+
+    A shard below the pool thresholds, e.g. a small daily file, is written
+    inline. Returns the same as clean_shard.
+    """
+
+    row_counts, df, descriptions, state = read_shard(shard)
+    if worth_pool(shard["size"], len(df)):
+        list(map_groups(write_shard, df, Fields.ora_location_id, {"name": shard["name"], "state": state}))
+    else:
+        write_shard({"name": shard["name"], "df": df, "state": state})
+
+    return row_counts, descriptions, state, df[[Fields.ora_menu_item_id, Fields.date]].drop_duplicates()
+
+
+def update_items(bronze_dates, descriptions, old_state, item_dates, item_cost, result=None):
+
+    # flags and cost of every item, given every description seen so far
+    used_states = []
+    if result is not None:
+        descriptions = item_descriptions(pd.concat([descriptions, result[1]], ignore_index=True))
+        used_states = [result[2]]
+        item_dates = merge_item_dates(item_dates, result[3])
+    new_state = make_item_state(descriptions, item_cost)
+
+    # rewrite only the history affected by rule, item cost or new description changes
+    if old_state is not None:
+        used_states = [old_state] + used_states
+    elif len(bronze_dates) > 0:
+        used_states = None
+
+    dates = changed_dates(used_states, new_state, item_dates)
+    if len(dates) > 0:
+        rewrite_partitions(
+            Storage.bronze, Storage.bronze_oracle_employees, dates,
+            lambda d: apply_item_state(d, new_state),
+            schema=Schemas.oracle_employees,
+        )
+        logger.info(f"Recomputed flags and margin of {len(dates)} business dates")
+
+    return descriptions, new_state, item_dates
+
+
+def main():
+    # list new or changed staging files
+    manifest_df = read_manifest(Storage.manifest_oracle_employees)
+    blobs = list_blob_properties(container_name=Storage.staging, blob_path=Storage.staging_oracle_employees)
+    blobs = new_staging_files(blobs, manifest_df)
+    if len(blobs) == 0:
+        logger.info("No new staging files for oracle employees")
+
+    # business dates already in bronze
+    bronze_dates = read_bronze_dates()
+
+    # items known so far
+    descriptions, item_state = read_item_state()
+    if descriptions is None:
+        descriptions = pd.DataFrame(columns=[Fields.ora_menu_item_id] + ITEM_COLUMNS).astype({
+            Fields.ora_menu_item_id: "int64",
+        })
+        if len(bronze_dates) > 0:
+            descriptions = item_descriptions(read_dataset(
+                Storage.bronze, Storage.bronze_oracle_employees, columns=[Fields.ora_menu_item_id] + ITEM_COLUMNS
+            ))
+    item_dates = read_item_dates(bronze_dates)
+    item_cost = read_item_cost()
+
+    # item cost changes are applied to bronze even without new files
+    if len(blobs) == 0:
+        descriptions, item_state, item_dates = update_items(
+            bronze_dates, descriptions, item_state, item_dates, item_cost
+        )
+        write_item_state(descriptions, item_state, item_dates)
+        return
+
+    # clean chunks of staging files in parallel processes
+    sizes = {b["name"]: b["size"] for b in blobs}
+    shards = [
+        {
+            "name": shard_name(files),
+            "files": files,
+            "size": sum(sizes[f] for f in files),
+            "bronze_dates": bronze_dates,
+            "descriptions": descriptions,
+            "item_cost": item_cost,
+        }
+        for files in file_shards(blobs)
+    ]
+    # a daily run is a single file, a large one has its locations spread over the processes instead
+    if len(shards) == 1:
+        results = [clean_locations(shards[0])]
+    else:
+        results = map_shards(clean_shard, shards)
+    for shard, result in zip(shards, results):
+
+        # each chunk is committed on its own, an interrupted backfill resumes after it
+        files = set(shard["files"])
+        descriptions, item_state, item_dates = update_items(
+            bronze_dates, descriptions, item_state, item_dates, item_cost, result
+        )
+        write_item_state(descriptions, item_state, item_dates)
+        manifest_df = update_manifest(
+            Storage.manifest_oracle_employees, manifest_df,
+            [b for b in blobs if b["name"] in files],
+            row_counts=result[0],
+        )
+        logger.info(f"Processed {len(shard['files'])} staging files from {shard['files'][0]}")
 
 
 if __name__ == "__main__":
@@ -1,74 +1,133 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from grptavutils import (
-    list_blob_files, read_parquet, read_csv, write_parquet,
-    delete_blob_file, delete_staging_files, read_excel
-
-)
+from grptavutils import read_staging_tables, read_parquet, write_parquet, list_blob_properties
 from grptavutils.constants import Fields, Storage
+from grptavutils.dimensions import read_dimension
+from grptavutils.manifest import read_manifest, new_staging_files, staging_row_counts, update_manifest
+from grptavutils.normalise import normalise
+from grptavutils.partitions import (
+    list_partition_dates, migrate_to_partitions, partition_path, read_dataset, rewrite_partitions,
+    split_part_name, write_partitions,
+)
+from grptavutils.schemas import Schemas, cast_frame, concat_frames, csv_column_types
+from grptavutils.shards import file_shards, map_groups, map_shards, shard_name, worth_pool
 from grptavutils.logs import logger
+from grptavutils.metrics import bind
 
+# monthly files of the guests index
+_index_pattern = re.compile(r"/month=\d{4}-\d{2}\.parquet$")
 
-def read_employee_hours():
+# day periods by period code, checks closed from 7 to 17 are lunch
+PERIODS = ["Cena", "Pranzo"]
+LUNCH_HOURS = (7, 17)
+
+
+def convert_employee_hours(df_in):
+
+    df = df_in[[Fields.ora_employee_id, Fields.period_of_day, Fields.hours_per_week]].copy()
+    df[Fields.shift_id] = df[Fields.ora_employee_id].astype(str) + "//" + df[Fields.period_of_day]
 
-    df = read_excel(Storage.bronze, Storage.employee_hours)
-    df = df.drop(columns=[Fields.ora_employee_first_name, Fields.ora_employee_last_name])
+    # force 0 hours to null
+    zero_hours = df[Fields.hours_per_week] == 0
+    df.loc[zero_hours, Fields.hours_per_week] = None
+
+    # ensure no duplicates
+    df = df.drop_duplicates(subset=[Fields.shift_id])
 
     return df
 
-def read_bronze():
-    try:
-        df = read_parquet(Storage.bronze, Storage.bronze_oracle_guests)
-        return df
 
-    except FileNotFoundError:
-        empty_df = pd.DataFrame(columns=[
-            Fields.filename,
-            Fields.ora_guest_check_id,
-            Fields.ora_employee_id,
-            Fields.ora_rev_center_id,
-            Fields.ora_location_id,
-            Fields.ora_order_type_id,
-            Fields.date,
-            Fields.ora_check_open_datetime,
-            Fields.ora_check_close_datetime,
-            Fields.ora_num_guests,
-            Fields.ora_check_total,
-            Fields.ora_void_total,
-            Fields.ora_tip_total,
-            Fields.ora_error_correct_total,
-            Fields.ora_transfer_status_code,
-            Fields.ora_transfer_status,
-            Fields.ora_transfer_to_check_num,
-            Fields.ora_service_charge,
-            Fields.ora_discount_total,
-            Fields.ora_check_sub_total,
-            Fields.ora_order_type_name,
-            Fields.ora_guest_employee_first_name,
-            Fields.ora_guest_employee_last_name,
-            Fields.ora_check_duration,
-            Fields.ora_table_reference,
-            Fields.ora_check_tot_items,
-            Fields.ora_error_correct_count,
-            Fields.ora_is_employee_meal,
-            Fields.hours_per_week,
-        ])
-
-        return empty_df
-
-
-def read_staging():
-    files = list_blob_files(container_name=Storage.staging, blob_path="oracle/Guest")
-
-    # iterate over files
-    df = pd.DataFrame()
-    for f in files:
-        try:
-            current_df = read_csv(container=Storage.staging, file_path=f, sep=";", decimal=".")
-            current_df.loc[:, Fields.filename] = f
-            df = pd.concat([df, current_df])
-        except pd.errors.EmptyDataError:
-            delete_blob_file(container_name=Storage.staging, file_path=f)
+def read_employee_hours():
+
+    # excel is parsed only when a new version is uploaded
+    df = read_dimension("employee_hours", Storage.employee_hours, convert_employee_hours, schema=Schemas.employee_hours)
+
+    # keyed like the checks, rows of unknown periods never match
+    codes = pd.Categorical(df[Fields.period_of_day], categories=PERIODS).codes
+    df = df[codes >= 0]
+    keys = shift_keys(df[Fields.ora_employee_id], codes[codes >= 0])
+
+    return pd.Series(df[Fields.hours_per_week].to_numpy(), index=keys, name=Fields.hours_per_week)
+
+
+def read_bronze_dates():
+    migrate_to_partitions(
+        Storage.bronze, Storage.legacy_bronze_oracle_guests, Storage.bronze_oracle_guests,
+        schema=Schemas.oracle_guests,
+    )
+    dates = list_partition_dates(Storage.bronze, Storage.bronze_oracle_guests)
+
+    return dates
+
+
+def merge_guests_index(index_df, df):
+
+    # sorted by guest_check_id for binary search lookups
+    df = pd.concat([index_df, df[[Fields.ora_guest_check_id, Fields.date]]], ignore_index=True)
+    df = df.drop_duplicates(subset=[Fields.ora_guest_check_id])
+    df[Fields.ora_guest_check_id] = df[Fields.ora_guest_check_id].astype("int64")
+
+    return df.sort_values(Fields.ora_guest_check_id, kind="mergesort").reset_index(drop=True)
+
+
+def guests_index_path(month):
+    return f"{Storage.bronze_oracle_guests_index}/month={month.strftime('%Y-%m')}.parquet"
 
+
+def read_guests_index(bronze_dates):
+
+    # guest_check_ids already in bronze with their business date, one file per month
+    index_df = pd.DataFrame({
+        Fields.ora_guest_check_id: pd.Series(dtype="int64"),
+        Fields.date: pd.Series(dtype="datetime64[ns]"),
+    })
+    blobs = list_blob_properties(container_name=Storage.bronze, blob_path=f"{Storage.bronze_oracle_guests_index}/")
+    blobs = [b for b in blobs if _index_pattern.search(b["name"]) is not None]
+    with ThreadPoolExecutor(max_workers=Storage.max_workers) as executor:
+        dfs = list(executor.map(bind(lambda b: read_parquet(Storage.bronze, b["name"], etag=b["etag"])), blobs))
+    index_df = concat_frames([index_df] + dfs)
+
+    # partitions missing from the index, all of them the first time
+    missing = sorted(set(bronze_dates) - set(pd.DatetimeIndex(index_df[Fields.date].unique())))
+    df = index_df.iloc[:0]
+    if len(missing) > 0:
+        logger.info(f"Adding {len(missing)} business dates to the guests index")
+        df = read_dataset(
+            Storage.bronze, Storage.bronze_oracle_guests,
+            columns=[Fields.ora_guest_check_id, Fields.date], dates=missing,
+        )
+    index_df = merge_guests_index(index_df, df)
+    if len(missing) > 0:
+        write_guests_index(index_df, missing)
+
+    return index_df
+
+
+def write_guests_index(index_df, dates):
+
+    # only the months of the given business dates are rewritten
+    months = index_df[Fields.date].dt.to_period("M")
+    for month in sorted(set(pd.DatetimeIndex(dates).to_period("M"))):
+        write_parquet(
+            dataframe=index_df[months == month], container=Storage.bronze, file_path=guests_index_path(month)
+        )
+
+
+def known_ids(ids, index_df):
+
+    # membership by binary search in the sorted index
+    sorted_ids = index_df[Fields.ora_guest_check_id].to_numpy()
+    values = ids.to_numpy().astype("int64")
+    if len(sorted_ids) == 0:
+        return np.zeros(len(values), dtype=bool)
+    pos = np.searchsorted(sorted_ids, values).clip(max=len(sorted_ids) - 1)
+
+    return sorted_ids[pos] == values
+
+
+def read_staging(files):
     # rename columns
     ren_cols = {
         Fields.filename: Fields.filename,
@@ -101,130 +160,106 @@ def read_staging():
         "employeeLastName": Fields.ora_guest_employee_last_name,
         "tableReference": Fields.ora_table_reference,
     }
-    df = df.rename(columns=ren_cols)
+
+    # parse only the mapped columns, typed as in the bronze schema
+    table = read_staging_tables(
+        container=Storage.staging,
+        files=files,
+        sep=";",
+        include_columns=[c for c in ren_cols if c != Fields.filename],
+        column_types=csv_column_types(ren_cols, Schemas.oracle_guests),
+        timestamp_parsers=["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"],
+    )
+    table = table.rename_columns([ren_cols.get(c, c) for c in table.column_names])
 
     # select
     sel = list(ren_cols.values())
-    df = df[sel]
-
-    # data types
-    df[Fields.date] = pd.to_datetime(df[Fields.date], format="%Y-%m-%d")
-    df[Fields.ora_check_close_datetime] = pd.to_datetime(df[Fields.ora_check_close_datetime], format="%Y-%m-%dT%H:%M:%S")
-    df[Fields.ora_check_open_datetime] = pd.to_datetime(df[Fields.ora_check_open_datetime], format="%Y-%m-%dT%H:%M:%S")
-    df[Fields.ora_guest_check_id] = df[Fields.ora_guest_check_id].astype("int", errors="ignore")
-    df[Fields.ora_guest_employee_id] = df[Fields.ora_guest_employee_id].astype("int", errors="ignore")
-    df[Fields.ora_rev_center_id] = df[Fields.ora_rev_center_id].astype("int", errors="ignore")
-    df[Fields.ora_location_id] = df[Fields.ora_location_id].astype("int", errors="ignore")
-    df[Fields.ora_order_type_id] = df[Fields.ora_order_type_id].astype("int", errors="ignore")
-    df[Fields.ora_num_guests] = df[Fields.ora_num_guests].astype("int", errors="ignore")
-    df[Fields.ora_check_total] = df[Fields.ora_check_total].astype("double", errors="ignore")
-    df[Fields.ora_void_total] = df[Fields.ora_void_total].astype("double", errors="ignore")
-    df[Fields.ora_tip_total] = df[Fields.ora_tip_total].astype("double", errors="ignore")
-    df[Fields.ora_error_correct_total] = df[Fields.ora_error_correct_total].astype("double", errors="ignore")
-    df[Fields.ora_transfer_to_check_num] = df[Fields.ora_transfer_to_check_num].astype("int", errors="ignore")
-    df[Fields.ora_service_charge] = df[Fields.ora_service_charge].astype("double", errors="ignore")
-    df[Fields.ora_discount_total] = df[Fields.ora_discount_total].astype("double", errors="ignore")
-    df[Fields.ora_check_sub_total] = df[Fields.ora_check_sub_total].astype("double", errors="ignore")
-    df[Fields.ora_check_duration] = df[Fields.ora_check_duration].astype("int", errors="ignore")
-    df[Fields.ora_check_tot_items] = df[Fields.ora_check_tot_items].astype("int", errors="ignore")
-    df[Fields.ora_error_correct_count] = df[Fields.ora_error_correct_count].astype("int", errors="ignore")
-    df[Fields.ora_is_employee_meal] = df[Fields.ora_is_employee_meal].astype("int", errors="ignore")
-
-    # initcap
-    df[Fields.ora_transfer_status_code] = df[Fields.ora_transfer_status_code].str.capitalize()
-    df[Fields.ora_transfer_status] = df[Fields.ora_transfer_status].str.capitalize()
-    df[Fields.ora_guest_employee_first_name] = df[Fields.ora_guest_employee_first_name].str.capitalize()
-    df[Fields.ora_guest_employee_last_name] = df[Fields.ora_guest_employee_last_name].str.capitalize()
-    df[Fields.ora_table_reference] = df[Fields.ora_table_reference].str.capitalize()
-
-    # fill missing
-    df[Fields.ora_guest_check_id] = df[Fields.ora_guest_check_id].fillna(0)
-    df[Fields.ora_employee_id] = df[Fields.ora_employee_id].fillna(0)
-    df[Fields.ora_rev_center_id] = df[Fields.ora_rev_center_id].fillna(0)
-    df[Fields.ora_location_id] = df[Fields.ora_location_id].fillna(0)
-    df[Fields.ora_order_type_id] = df[Fields.ora_order_type_id].fillna(0)
-    df[Fields.ora_num_guests] = df[Fields.ora_num_guests].fillna(0)
-    df[Fields.ora_check_total] = df[Fields.ora_check_total].fillna(0)
-    df[Fields.ora_void_total] = df[Fields.ora_void_total].fillna(0)
-    df[Fields.ora_tip_total] = df[Fields.ora_tip_total].fillna(0)
-    df[Fields.ora_error_correct_total] = df[Fields.ora_error_correct_total].fillna(0)
-    df[Fields.ora_transfer_to_check_num] = df[Fields.ora_transfer_to_check_num].fillna(0)
-    df[Fields.ora_service_charge] = df[Fields.ora_service_charge].fillna(0)
-    df[Fields.ora_discount_total] = df[Fields.ora_discount_total].fillna(0)
-    df[Fields.ora_check_sub_total] = df[Fields.ora_check_sub_total].fillna(0)
-    df[Fields.ora_check_duration] = df[Fields.ora_check_duration].fillna(0)
-    df[Fields.ora_check_tot_items] = df[Fields.ora_check_tot_items].fillna(0)
-    df[Fields.ora_error_correct_count] = df[Fields.ora_error_correct_count].fillna(0)
-    df[Fields.ora_is_employee_meal] = df[Fields.ora_is_employee_meal].fillna(0)
-    df[Fields.ora_transfer_status_code] = df[Fields.ora_transfer_status_code].fillna(Fields.missing)
-    df[Fields.ora_transfer_status] = df[Fields.ora_transfer_status].fillna(Fields.missing)
-    df[Fields.ora_guest_employee_first_name] = df[Fields.ora_guest_employee_first_name].fillna(Fields.missing)
-    df[Fields.ora_guest_employee_last_name] = df[Fields.ora_guest_employee_last_name].fillna(Fields.missing)
-    df[Fields.ora_table_reference] = df[Fields.ora_table_reference].fillna(Fields.missing)
+    df = table.select(sel).to_pandas()
+
+    # initcap and fill missing, once per distinct value
+    df = normalise(df, {
+        Fields.ora_transfer_status_code: {"capitalize": True, "fillna": Fields.missing},
+        Fields.ora_transfer_status: {"capitalize": True, "fillna": Fields.missing},
+        Fields.ora_guest_employee_first_name: {"capitalize": True, "fillna": Fields.missing},
+        Fields.ora_guest_employee_last_name: {"capitalize": True, "fillna": Fields.missing},
+        Fields.ora_table_reference: {"capitalize": True, "fillna": Fields.missing},
+        Fields.ora_guest_check_id: {"fillna": 0},
+        Fields.ora_employee_id: {"fillna": 0},
+        Fields.ora_rev_center_id: {"fillna": 0},
+        Fields.ora_location_id: {"fillna": 0},
+        Fields.ora_order_type_id: {"fillna": 0},
+        Fields.ora_num_guests: {"fillna": 0},
+        Fields.ora_check_total: {"fillna": 0},
+        Fields.ora_void_total: {"fillna": 0},
+        Fields.ora_tip_total: {"fillna": 0},
+        Fields.ora_error_correct_total: {"fillna": 0},
+        Fields.ora_transfer_to_check_num: {"fillna": 0},
+        Fields.ora_service_charge: {"fillna": 0},
+        Fields.ora_discount_total: {"fillna": 0},
+        Fields.ora_check_sub_total: {"fillna": 0},
+        Fields.ora_check_duration: {"fillna": 0},
+        Fields.ora_check_tot_items: {"fillna": 0},
+        Fields.ora_error_correct_count: {"fillna": 0},
+        Fields.ora_is_employee_meal: {"fillna": 0},
+    })
+
+    # compact types
+    df = cast_frame(df, Schemas.oracle_guests)
 
     return df
 
 
-def trunc_staging(bronze_df, staging_df):
-    dates = bronze_df[Fields.date].unique()
-    mask = staging_df[Fields.date].isin(dates)
+def trunc_staging(bronze_dates, staging_df):
+    mask = staging_df[Fields.date].isin(bronze_dates)
     trunc_df = staging_df[~mask]
 
     return trunc_df
 
-def day_period(df_in: pd.DataFrame) -> None:
 
-    df_in[Fields.period_of_day] = df_in["check_close_datetime"].dt.hour.map({
-            0: "Cena",
-            1: "Cena",
-            2: "Cena",
-            3: "Cena",
-            4: "Cena",
-            5: "Cena",
-            6: "Cena",
-            7: "Pranzo",
-            8: "Pranzo",
-            9: "Pranzo",
-            10: "Pranzo",
-            11: "Pranzo",
-            12: "Pranzo",
-            13: "Pranzo",
-            14: "Pranzo",
-            15: "Pranzo",
-            16: "Pranzo",
-            17: "Pranzo",
-            18: "Cena",
-            19: "Cena",
-            20: "Cena",
-            21: "Cena",
-            22: "Cena",
-            23: "Cena",
-        })
-
-    df_in[Fields.shift_id] = df_in[Fields.ora_employee_id].astype(str) + "//" + df_in[Fields.period_of_day]
+def period_codes(hours):
 
-    return df_in
+    # -1 when the close time is missing
+    codes = ((hours >= LUNCH_HOURS[0]) & (hours <= LUNCH_HOURS[1])).to_numpy().astype("int8")
+    codes[hours.isna().to_numpy()] = -1
 
-def calc_productivity(df_in):
+    return codes
 
-    # read productivity data and make key
-    emp_df = read_employee_hours()
-    emp_df[Fields.shift_id] = emp_df[Fields.ora_employee_id].astype(str) + "//" + emp_df[Fields.period_of_day]
-    emp_df = emp_df[[Fields.shift_id, Fields.hours_per_week]]
 
-    # force 0 hours to null
-    zero_hours = emp_df[Fields.hours_per_week] == 0
-    emp_df.loc[zero_hours, Fields.hours_per_week] = None
+def shift_keys(employee_ids, codes):
 
-    # ensure no duplicates
-    emp_df = emp_df.drop_duplicates(subset=[Fields.shift_id])
+    # one integer per (employee_id, period_code) pair, -1 without a period
+    keys = employee_ids.to_numpy().astype("int64") * len(PERIODS) + codes
 
-    # join and calculate productivity
-    df = (
-        df_in
-        .drop(columns=Fields.hours_per_week)
-        .merge(emp_df, on=Fields.shift_id, how="left")
+    return np.where(codes >= 0, keys, -1)
+
+
+def day_period(df_in: pd.DataFrame) -> None:
+
+    codes = period_codes(df_in[Fields.ora_check_close_datetime].dt.hour)
+    df_in[Fields.period_of_day] = pd.Categorical.from_codes(codes, categories=PERIODS)
+
+    # readable shift_id built once per distinct shift
+    keys = shift_keys(df_in[Fields.ora_employee_id], codes)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    if len(unique_keys) > 0 and unique_keys[0] == -1:
+        unique_keys = unique_keys[1:]
+        inverse = inverse - 1
+    labels = (
+        pd.Series(unique_keys // len(PERIODS)).astype(str)
+        + "//"
+        + np.array(PERIODS, dtype=object)[unique_keys % len(PERIODS)]
     )
+    df_in[Fields.shift_id] = pd.Categorical.from_codes(inverse, categories=labels)
+
+    return df_in
+
+
+def calc_productivity(df_in, hours):
+
+    # hours of each row's shift with one integer keyed lookup
+    keys = shift_keys(df_in[Fields.ora_employee_id], df_in[Fields.period_of_day].cat.codes.to_numpy())
+    df = df_in.copy()
+    df[Fields.hours_per_week] = hours.reindex(keys).to_numpy()
     df[Fields.productivity] = df[Fields.ora_check_total] / df[Fields.hours_per_week]
 
     # fill missing
@@ -234,44 +269,220 @@ def calc_productivity(df_in):
     return df
 
 
+def read_shard(shard):
 
+    staging_df = read_staging(files=shard["files"])
 
-def main():
+    # drop form staging already available data
+    trunc_df = trunc_staging(bronze_dates=shard["bronze_dates"], staging_df=staging_df)
+    df = trunc_df.drop(columns=Fields.filename)
 
-    # read bronze
-    bronze_df = read_bronze()
+    # drop duplicates before any enrichment, bronze checks win
+    df = df.drop_duplicates(subset=[Fields.ora_guest_check_id])
+    df = df[~known_ids(df[Fields.ora_guest_check_id], shard["index"])].copy()
 
-    # read staging
-    staging_df = read_staging()
+    written_df = df[[Fields.ora_guest_check_id, Fields.date, Fields.ora_location_id]].copy()
+    written_df[Fields.filename] = shard["name"]
 
-    # drop form staging already available data
-    trunc_df = trunc_staging(bronze_df=bronze_df, staging_df=staging_df)
+    return staging_row_counts(staging_df), df, written_df
 
-    # append to bronze
-    df = pd.concat([
-        bronze_df,
-        trunc_df.drop(columns=Fields.filename)
-    ])
+
+def write_shard(shard):
 
     # make day period
-    day_period(df)
+    df = day_period(shard["df"])
 
     # calculate productivity
-    df = calc_productivity(df)
-
-    # drop duplicates
-    df = df.drop_duplicates(subset=[Fields.ora_guest_check_id])
+    df = calc_productivity(df, shard["hours"])
 
-    # write
-    write_parquet(
+    # write new business dates only
+    write_partitions(
         dataframe=df,
         container=Storage.bronze,
-        file_path=Storage.bronze_oracle_guests,
+        dataset_path=Storage.bronze_oracle_guests,
+        part_name=shard["name"],
+        schema=Schemas.oracle_guests,
+        split_by=Fields.ora_location_id,
     )
 
-    # delete files from blob
-    files = list(staging_df[Fields.filename].unique())
-    #delete_staging_files(files)
+
+def apply_hours(df_in, hours):
+
+    # period codes as written, read back the categories may hold one period only
+    df = df_in.copy()
+    df[Fields.period_of_day] = pd.Categorical(df[Fields.period_of_day], categories=PERIODS)
+
+    return calc_productivity(df, hours)
+
+
+def read_used_hours():
+
+    # hours bronze rows were written with, by shift key
+    try:
+        df = read_parquet(Storage.bronze, Storage.bronze_oracle_guests_hours)
+        return df.set_index(Fields.shift_key)[Fields.hours_per_week]
+
+    except FileNotFoundError:
+        return None
+
+
+def write_used_hours(hours):
+    df = hours.rename_axis(Fields.shift_key).reset_index()
+    write_parquet(dataframe=df, container=Storage.bronze, file_path=Storage.bronze_oracle_guests_hours)
+
+
+def _differs(old, new):
+    return ~np.isclose(old.to_numpy(dtype="float64"), new.to_numpy(dtype="float64"), equal_nan=True)
+
+
+def changed_hours_dates(used_hours, hours):
+    """Business dates holding shifts whose hours differ from the ones their rows were written with.
+
+    used_hours are the hours rows were written with, None when unknown.
+    """
+
+    columns = [Fields.date, Fields.ora_employee_id, Fields.period_of_day]
+    if used_hours is not None:
+        keys = used_hours.index.union(hours.index)
+        changed = keys[_differs(used_hours.reindex(keys), hours.reindex(keys))]
+        if len(changed) == 0:
+            return pd.DatetimeIndex([])
+
+        # rows of the employees of changed shifts, then of the shifts themselves
+        employee_ids = sorted(set((changed // len(PERIODS)).tolist()))
+        df = read_dataset(
+            Storage.bronze, Storage.bronze_oracle_guests, columns=columns,
+            filters=[(Fields.ora_employee_id, "in", employee_ids)],
+        )
+        codes = pd.Categorical(df[Fields.period_of_day], categories=PERIODS).codes
+        mask = np.isin(shift_keys(df[Fields.ora_employee_id], codes), changed)
+        logger.info(f"Hours changed for {len(changed)} shifts")
+
+        return pd.DatetimeIndex(df.loc[mask, Fields.date].unique())
+
+    # first run without used hours, compare every bronze row once
+    df = read_dataset(Storage.bronze, Storage.bronze_oracle_guests, columns=columns + [Fields.hours_per_week])
+    codes = pd.Categorical(df[Fields.period_of_day], categories=PERIODS).codes
+    expected = hours.reindex(shift_keys(df[Fields.ora_employee_id], codes)).fillna(0)
+    changed = _differs(df[Fields.hours_per_week], expected)
+
+    return pd.DatetimeIndex(df.loc[changed, Fields.date].unique())
+
+
+def update_hours(bronze_dates, hours):
+
+    # a new employee hours upload is applied to the history it changes
+    used_hours = read_used_hours()
+    if used_hours is None and len(bronze_dates) == 0:
+        write_used_hours(hours)
+        return
+
+    dates = changed_hours_dates(used_hours, hours)
+    if len(dates) > 0:
+        rewrite_partitions(
+            Storage.bronze, Storage.bronze_oracle_guests, dates,
+            lambda d: apply_hours(d, hours),
+            schema=Schemas.oracle_guests,
+        )
+        logger.info(f"Recomputed hours and productivity of {len(dates)} business dates")
+    write_used_hours(hours)
+
+
+def clean_shard(shard):
+    """Cleans the staging files of one shard, one bronze file per location and business date.
+
+    Returns the rows read from each staging file and the guest_check_ids written,
+    with their business date, location and shard.
+    """
+
+    row_counts, df, written_df = read_shard(shard)
+    write_shard({"name": shard["name"], "df": df, "hours": shard["hours"]})
+
+    return row_counts, written_df
+
+
+def clean_locations(shard):
+    """Cleans a single shard, its locations enriched and written in parallel processes.
+
+    A shard below the pool thresholds, e.g. a small daily file, is written
+    inline. Returns the same as clean_shard.
+    """
+
+    row_counts, df, written_df = read_shard(shard)
+    if worth_pool(shard["size"], len(df)):
+        list(map_groups(write_shard, df, Fields.ora_location_id, {"name": shard["name"], "hours": shard["hours"]}))
+    else:
+        write_shard({"name": shard["name"], "df": df, "hours": shard["hours"]})
+
+    return row_counts, written_df
+
+
+def drop_shard_duplicates(written_df, index_df):
+
+    # checks already written by an earlier shard, the earlier shard wins
+    duplicated = known_ids(written_df[Fields.ora_guest_check_id], index_df)
+    groups = written_df[duplicated].groupby([Fields.date, Fields.ora_location_id, Fields.filename])
+    for (date, location_id, name), ids in groups[Fields.ora_guest_check_id]:
+        file_path = partition_path(
+            Storage.bronze_oracle_guests, date, split_part_name(Fields.ora_location_id, location_id, name)
+        )
+        df = read_parquet(Storage.bronze, file_path)
+        df = df[~df[Fields.ora_guest_check_id].isin(ids)]
+        write_parquet(dataframe=df, container=Storage.bronze, file_path=file_path, schema=Schemas.oracle_guests)
+        logger.info(f"Dropped {len(ids)} checks already written by another shard from {file_path}")
+
+    return written_df[~duplicated]
+
+
+def main():
+
+    # list new or changed staging files
+    manifest_df = read_manifest(Storage.manifest_oracle_guests)
+    blobs = list_blob_properties(container_name=Storage.staging, blob_path=Storage.staging_oracle_guests)
+    blobs = new_staging_files(blobs, manifest_df)
+
+    # employee hours changes are applied to bronze even without new files
+    bronze_dates = read_bronze_dates()
+    hours = read_employee_hours()
+    update_hours(bronze_dates, hours)
+    if len(blobs) == 0:
+        logger.info("No new staging files for oracle guests")
+        return
+
+    # checks already in bronze
+    index_df = read_guests_index(bronze_dates)
+
+    # clean chunks of staging files in parallel processes
+    sizes = {b["name"]: b["size"] for b in blobs}
+    shards = [
+        {
+            "name": shard_name(files),
+            "files": files,
+            "size": sum(sizes[f] for f in files),
+            "bronze_dates": bronze_dates,
+            "index": index_df,
+            "hours": hours,
+        }
+        for files in file_shards(blobs)
+    ]
+    # a daily run is a single file, a large one has its locations spread over the processes instead
+    if len(shards) == 1:
+        results = [clean_locations(shards[0])]
+    else:
+        results = map_shards(clean_shard, shards)
+    for shard, result in zip(shards, results):
+
+        # each chunk is committed on its own, an interrupted backfill resumes after it
+        files = set(shard["files"])
+        written_df = drop_shard_duplicates(result[1], index_df)
+        index_df = merge_guests_index(index_df, written_df)
+        write_guests_index(index_df, written_df[Fields.date].unique())
+        manifest_df = update_manifest(
+            Storage.manifest_oracle_guests, manifest_df,
+            [b for b in blobs if b["name"] in files],
+            row_counts=result[0],
+        )
+        logger.info(f"Processed {len(shard['files'])} staging files from {shard['files'][0]}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+import argparse
+import importlib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+from grptavutils.constants import Fields, Storage
+from grptavutils.frames import enable_frame_store
+from grptavutils.logs import logger
+from grptavutils.metrics import new_run_id, track_step
+from grptavutils.partitions import write_partitions
+
+
+class Step:
+    """A pipeline step, the main() of a module with the blobs it reads and writes.
+
+    A soft step only brings new data in, the steps reading its outputs still run
+    on the data already stored when it fails.
+    """
+
+    def __init__(self, name, module, inputs=(), outputs=(), soft=False):
+        self.name = name
+        self.module = module
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.soft = soft
+
+    def run(self):
+        importlib.import_module(self.module).main()
+
+
+def blob(container, path):
+    return f"{container}/{path}"
+
+
+STEPS = [
+    Step(
+        "ga_api", "googleanalytics.ga_api",
+        outputs=[
+            blob(Storage.bronze, Storage.bronze_ga),
+            blob(Storage.bronze, Storage.bronze_ga_channels),
+            blob(Storage.bronze, Storage.bronze_ga_daily),
+        ],
+        soft=True,
+    ),
+    Step(
+        "oracle_clean_employees", "oracle.oracle_clean_employees",
+        inputs=[blob(Storage.staging, Storage.staging_oracle_employees), blob(Storage.bronze, Storage.item_cost)],
+        outputs=[blob(Storage.bronze, Storage.bronze_oracle_employees)],
+    ),
+    Step(
+        "oracle_clean_guests", "oracle.oracle_clean_guests",
+        inputs=[blob(Storage.staging, Storage.staging_oracle_guests), blob(Storage.bronze, Storage.employee_hours)],
+        outputs=[blob(Storage.bronze, Storage.bronze_oracle_guests)],
+    ),
+    Step(
+        "sevenrooms", "sevenrooms.sevenrooms",
+        outputs=[
+            blob(Storage.staging, Storage.future_reservations),
+            blob(Storage.staging, Storage.yesterday_reservations),
+        ],
+        soft=True,
+    ),
+    Step(
+        "sevenrooms_clean_future", "sevenrooms.sevenrooms_clean_future",
+        inputs=[blob(Storage.staging, Storage.future_reservations)],
+        outputs=[blob(Storage.bronze, Storage.bronze_future_reservations)],
+    ),
+    Step(
+        "sevenrooms_clean_yesterday", "sevenrooms.sevenrooms_clean_yesterday",
+        inputs=[blob(Storage.staging, Storage.yesterday_reservations)],
+        outputs=[blob(Storage.bronze, Storage.bronze_yesterday_reservations)],
+    ),
+    Step(
+        "forecast", "forecast.forecast",
+        inputs=[blob(Storage.bronze, Storage.bronze_oracle_employees)],
+        outputs=[blob(Storage.bronze, Storage.bronze_forecast)],
+    ),
+    Step(
+        "silver", "silver.silver",
+        inputs=[
+            blob(Storage.bronze, Storage.bronze_oracle_employees),
+            blob(Storage.bronze, Storage.bronze_oracle_guests),
+            blob(Storage.bronze, Storage.bronze_ga_daily),
+            blob(Storage.bronze, Storage.bronze_yesterday_reservations),
+            blob(Storage.bronze, Storage.bronze_forecast),
+            blob(Storage.bronze, Storage.bronze_future_reservations),
+        ],
+        outputs=[
+            blob(Storage.silver, Storage.silver_dates),
+            blob(Storage.silver, Storage.silver_employees),
+            blob(Storage.silver, Storage.silver_items),
+        ],
+    ),
+]
+
+
+def dependencies(steps):
+
+    # a step depends on the steps writing any of its inputs
+    producers = {}
+    for s in steps:
+        for o in s.outputs:
+            producers[o] = s.name
+
+    deps = {}
+    for s in steps:
+        deps[s.name] = sorted({producers[i] for i in s.inputs if i in producers and producers[i] != s.name})
+
+    return deps
+
+
+def select_steps(steps, names):
+
+    unknown = set(names) - {s.name for s in steps}
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown pipeline steps: {', '.join(sorted(unknown))}")
+
+    # steps left out are assumed to be up to date
+    return [s for s in steps if s.name in names]
+
+
+def run_step(step, run_id, records):
+
+    logger.info(f"Starting step {step.name}")
+    start = time.perf_counter()
+    try:
+        with track_step(run_id, step.name) as metrics:
+            step.run()
+    except Exception:
+        logger.exception(f"Step {step.name} failed after {time.perf_counter() - start:.1f}s")
+        return False
+    finally:
+        records.append(metrics.to_dict())
+
+    logger.info(f"Finished step {step.name} in {time.perf_counter() - start:.1f}s")
+
+    return True
+
+
+def write_metrics(records):
+
+    # history of every run, to spot steps slowing down as volumes grow
+    df = pd.DataFrame(records)
+    df[Fields.date] = pd.Timestamp(df["start_time"].min()).normalize()
+    df["start_time"] = pd.to_datetime(df["start_time"])
+    write_partitions(df, container=Storage.bronze, dataset_path=Storage.metrics_runs, part_name=df["run_id"].iloc[0])
+
+
+def run_pipeline(steps=STEPS, max_workers=None):
+
+    # dataframes written by a step are handed in memory to the steps reading them
+    frame_store = enable_frame_store()
+    frame_store.clear()
+    for s in steps:
+        frame_store.want(s.inputs)
+
+    run_id = new_run_id()
+    logger.info(f"Starting pipeline run {run_id}")
+    records = []
+
+    deps = dependencies(steps)
+    by_name = {s.name: s for s in steps}
+    pending = dict(deps)
+    running = {}
+    status = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(steps)) as executor:
+        while len(pending) > 0 or len(running) > 0:
+
+            # skip everything downstream of a failed step, unless it is soft
+            skipped = True
+            while skipped:
+                skipped = False
+                for name, d in list(pending.items()):
+                    failed = [x for x in d if status.get(x) in ("failed", "skipped") and not by_name[x].soft]
+                    if len(failed) > 0:
+                        logger.warning(f"Skipping step {name}, upstream step {failed[0]} did not complete")
+                        status[name] = "skipped"
+                        frame_store.release(by_name[name].inputs)
+                        del pending[name]
+                        skipped = True
+
+            # start every step whose dependencies are done, soft ones may have failed
+            for name, d in list(pending.items()):
+                if all(status.get(x) == "done" or (by_name[x].soft and x in status) for x in d):
+                    running[executor.submit(run_step, by_name[name], run_id, records)] = name
+                    del pending[name]
+
+            if len(running) == 0:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for f in finished:
+                name = running.pop(f)
+                status[name] = "done" if f.result() else "failed"
+                frame_store.release(by_name[name].inputs)
+
+    # metrics must never fail the run
+    if len(records) > 0:
+        try:
+            write_metrics(records)
+        except Exception:
+            logger.exception(f"Could not save metrics of run {run_id}")
+
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the daily pipeline")
+    parser.add_argument("--steps", nargs="+", help="run only these steps")
+    parser.add_argument("--max-workers", type=int, default=None, help="steps running at the same time")
+    args = parser.parse_args()
+
+    steps = STEPS
+    if args.steps is not None:
+        steps = select_steps(STEPS, args.steps)
+
+    status = run_pipeline(steps, max_workers=args.max_workers)
+    if any(s != "done" for s in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
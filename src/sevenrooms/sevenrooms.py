@@ -21,7 +21,7 @@ def login():
 
     return mailbox
 
-def download_attachment(email_id):
+def download_attachment(mailbox, email_id):
 
     _, data = mailbox.fetch(email_id, '(RFC822)')
     raw_email = data[0][1]
@@ -61,7 +61,7 @@ def parse_uid(data):
     return match.group('uid')
 
 
-if __name__ == "__main__":
+def main():
 
     # login
     mailbox = login()
@@ -78,7 +78,7 @@ if __name__ == "__main__":
         num_retries = 5
         while num_retries > 0:
             try:
-                download_attachment(msg)
+                download_attachment(mailbox, msg)
                 num_retries = 0
             except imaplib.IMAP4.error:
                 logger.warn(f"imap error, retrying, remaining attempts {num_retries}")
@@ -98,3 +98,6 @@ if __name__ == "__main__":
     # logout
     mailbox.logout()
 
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import pandas as pd
-from grptavutils import list_blob_files, read_parquet, read_csv, write_parquet, delete_blob_file, delete_staging_files
+from grptavutils import read_parquet, write_parquet
 from grptavutils.constants import Fields, Storage
+from grptavutils.normalise import normalise
+from grptavutils.schemas import Schemas, cast_frame
 from grptavutils.logs import logger
 import datetime
 
@@ -41,26 +43,24 @@ def read_staging():
     df[Fields.update_date] = pd.to_datetime(df[Fields.update_date])
     df[Fields.update_time] = pd.to_datetime(df[Fields.update_time])
 
-    # replace
-    df[Fields.shift_name] = df[Fields.shift_name].replace({"DINNER": "Cena", "LUNCH": "Pranzo",})
-
-    # initcap
-    df[Fields.reservation_status] = df[Fields.reservation_status].str.capitalize()
-    df[Fields.detailed_status] = df[Fields.detailed_status].str.capitalize()
-    df[Fields.reservation_notes] = df[Fields.reservation_notes].str.capitalize()
-    df[Fields.reservation_tag] = df[Fields.reservation_tag].str.capitalize()
-    df[Fields.client_notes] = df[Fields.client_notes].str.capitalize()
-    df[Fields.booked_by] = df[Fields.booked_by].str.capitalize()
-
-    # nums
-    df[Fields.booked_covers] = df[Fields.booked_covers].astype("int")
-
-    # fill missing
-    df[Fields.booked_covers] = df[Fields.booked_covers].fillna(0)
+    # replace, initcap and fill missing, once per distinct value
+    df = normalise(df, {
+        Fields.shift_name: {"replace": {"DINNER": "Cena", "LUNCH": "Pranzo"}},
+        Fields.reservation_status: {"capitalize": True},
+        Fields.detailed_status: {"capitalize": True},
+        Fields.reservation_notes: {"capitalize": True},
+        Fields.reservation_tag: {"capitalize": True},
+        Fields.client_notes: {"capitalize": True},
+        Fields.booked_by: {"capitalize": True},
+        Fields.booked_covers: {"fillna": 0},
+    })
 
     # reference date for consistency with other datasets
     df[Fields.date] = df[Fields.reservation_date]
 
+    # compact types
+    df = cast_frame(df, Schemas.reservations)
+
     return df
 
 
@@ -80,6 +80,7 @@ def main():
         dataframe=df_out,
         container=Storage.bronze,
         file_path=Storage.bronze_future_reservations,
+        schema=Schemas.reservations,
     )
 
 
@@ -1,14 +1,60 @@
 import datetime
 
 import pandas as pd
-from grptavutils import list_blob_files, read_parquet, read_csv, write_parquet, delete_blob_file, delete_staging_files
+from grptavutils import read_parquet, read_staging_files, list_blob_properties, write_parquet
 from grptavutils.constants import Fields, Storage
+from grptavutils.manifest import read_manifest, new_staging_files, update_manifest
+from grptavutils.normalise import normalise
+from grptavutils.partitions import (
+    delete_partitions, list_partition_dates, migrate_to_partitions, read_dataset, write_partitions
+)
+from grptavutils.schemas import Schemas, cast_frame
 from grptavutils.logs import logger
 
 
-def read_bronze():
+def read_bronze_keys():
+    migrate_to_partitions(
+        Storage.bronze, Storage.legacy_bronze_yesterday_reservations, Storage.bronze_yesterday_reservations,
+        schema=Schemas.reservations,
+    )
+    dates = list_partition_dates(Storage.bronze, Storage.bronze_yesterday_reservations)
+
+    # confirmation_ids by business date, one small file instead of every partition
+    try:
+        keys_df = read_parquet(Storage.bronze, Storage.bronze_yesterday_reservations_index)
+    except FileNotFoundError:
+        keys_df = pd.DataFrame({
+            Fields.confirmation_id: pd.Series(dtype=object),
+            Fields.date: pd.Series(dtype="datetime64[ns]"),
+        })
+
+    # partitions missing from it, all of them the first time
+    missing = sorted(set(dates) - set(pd.DatetimeIndex(keys_df[Fields.date].unique())))
+    if len(missing) > 0:
+        logger.info(f"Adding {len(missing)} business dates to the reservations index")
+        df = read_dataset(
+            Storage.bronze, Storage.bronze_yesterday_reservations,
+            columns=[Fields.confirmation_id, Fields.date], dates=missing,
+        )
+        keys_df = pd.concat([keys_df, df], ignore_index=True)
+
+    return keys_df[keys_df[Fields.date].isin(dates)]
+
+
+def write_bronze_keys(keys_df, dates, df):
+
+    # keys of the rewritten dates replaced, the others kept
+    keys_df = pd.concat([
+        keys_df[~keys_df[Fields.date].isin(dates)],
+        df[[Fields.confirmation_id, Fields.date]],
+    ], ignore_index=True)
+    keys_df = keys_df.sort_values([Fields.date, Fields.confirmation_id], ignore_index=True)
+    write_parquet(dataframe=keys_df, container=Storage.bronze, file_path=Storage.bronze_yesterday_reservations_index)
+
+
+def read_bronze(dates):
     try:
-        df = read_parquet(Storage.bronze, Storage.yesterday_reservations)
+        df = read_dataset(Storage.bronze, Storage.bronze_yesterday_reservations, dates=dates)
         return df
 
     except FileNotFoundError:
@@ -32,18 +78,13 @@ def read_bronze():
         return empty_df
 
 
-def read_staging():
-    files = list_blob_files(container_name=Storage.staging, blob_path=Storage.yesterday_reservations)
-
-    # iterate over files
-    df = pd.DataFrame()
-    for f in files:
-        try:
-            current_df = read_parquet(container=Storage.staging, file_path=f)
-            current_df.loc[:, Fields.filename] = f
-            df = pd.concat([df, current_df])
-        except pd.errors.EmptyDataError:
-            delete_blob_file(container_name=Storage.staging, file_path=f)
+def read_staging(files):
+    # read files
+    df = read_staging_files(
+        container=Storage.staging,
+        files=files,
+        file_format="parquet",
+    )
 
     # rename columns
     ren_cols = {
@@ -78,26 +119,24 @@ def read_staging():
     df[Fields.update_date] = pd.to_datetime(df[Fields.update_date])
     df[Fields.update_time] = pd.to_datetime(df[Fields.update_time])
 
-    # replace
-    df[Fields.shift_name] = df[Fields.shift_name].replace({"DINNER": "Cena", "LUNCH": "Pranzo",})
-
-    # initcap
-    df[Fields.reservation_status] = df[Fields.reservation_status].str.capitalize()
-    df[Fields.detailed_status] = df[Fields.detailed_status].str.capitalize()
-    df[Fields.reservation_notes] = df[Fields.reservation_notes].str.capitalize()
-    df[Fields.reservation_tag] = df[Fields.reservation_tag].str.capitalize()
-    df[Fields.client_notes] = df[Fields.client_notes].str.capitalize()
-    df[Fields.booked_by] = df[Fields.booked_by].str.capitalize()
-
-    # nums
-    df[Fields.booked_covers] = df[Fields.booked_covers].astype("int")
-
-    # fill missing
-    df[Fields.booked_covers] = df[Fields.booked_covers].fillna(0)
+    # replace, initcap and fill missing, once per distinct value
+    df = normalise(df, {
+        Fields.shift_name: {"replace": {"DINNER": "Cena", "LUNCH": "Pranzo"}},
+        Fields.reservation_status: {"capitalize": True},
+        Fields.detailed_status: {"capitalize": True},
+        Fields.reservation_notes: {"capitalize": True},
+        Fields.reservation_tag: {"capitalize": True},
+        Fields.client_notes: {"capitalize": True},
+        Fields.booked_by: {"capitalize": True},
+        Fields.booked_covers: {"fillna": 0},
+    })
 
     # reference date for consistency with other datasets
     df[Fields.date] = df[Fields.reservation_date]
 
+    # compact types
+    df = cast_frame(df, Schemas.reservations)
+
     return df
 
 
@@ -122,25 +161,44 @@ def trunc_staging(bronze_df, staging_df):
 
 def main():
 
-    # read bronze
-    bronze_df = read_bronze()
+    # list new or changed staging files
+    manifest_df = read_manifest(Storage.manifest_yesterday_reservations)
+    blobs = list_blob_properties(container_name=Storage.staging, blob_path=Storage.yesterday_reservations)
+    blobs = new_staging_files(blobs, manifest_df)
+    if len(blobs) == 0:
+        logger.info("No new staging files for sevenrooms reservations")
+        return
 
     # read staging
-    staging_df = read_staging()
+    staging_df = read_staging(files=[b["name"] for b in blobs])
+
+    # dates touched by staging, including the old dates of rescheduled reservations
+    keys_df = read_bronze_keys()
+    mask = keys_df[Fields.confirmation_id].isin(staging_df[Fields.confirmation_id])
+    dates = set(staging_df[Fields.date]) | set(keys_df.loc[mask, Fields.date])
+
+    # read bronze partitions for those dates only
+    bronze_df = read_bronze(dates=dates)
 
     # drop form staging already available data
     trunc_df = trunc_staging(bronze_df=bronze_df, staging_df=staging_df)
 
-    # write
-    write_parquet(
+    # rewrite touched dates, drop the ones left empty
+    written_dates = write_partitions(
         dataframe=trunc_df,
         container=Storage.bronze,
-        file_path=Storage.bronze_yesterday_reservations,
+        dataset_path=Storage.bronze_yesterday_reservations,
+        schema=Schemas.reservations,
+    )
+    delete_partitions(
+        container=Storage.bronze,
+        dataset_path=Storage.bronze_yesterday_reservations,
+        dates=dates - set(written_dates),
     )
+    write_bronze_keys(keys_df, dates, trunc_df)
 
-    # delete files from blob
-    files = list(staging_df[Fields.filename].unique())
-    # delete_staging_files(files)
+    # mark files as processed
+    update_manifest(Storage.manifest_yesterday_reservations, manifest_df, blobs, staging_df)
 
 
 if __name__ == "__main__":
@@ -5,22 +5,37 @@ import numpy as np
 
 from grptavutils.constants import Fields, Storage
 from grptavutils import read_parquet, write_parquet
+from grptavutils.partitions import list_partition_dates, read_dataset
 
 
 
 def read_files():
-    files = [
-        Storage.bronze_oracle_employees,
-        Storage.bronze_oracle_guests,
-        Storage.bronze_ga,
-        Storage.bronze_forecast,
-        Storage.bronze_yesterday_reservations,
-        Storage.bronze_future_reservations,
-    ]
+    employee_cols = [Fields.ora_employee_id, Fields.ora_employee_first_name, Fields.ora_employee_last_name]
+    item_cols = [Fields.ora_menu_item_id, Fields.ora_menu_item_name, Fields.ora_menu_item_master_name,
+                 Fields.ora_major_group_name, Fields.ora_family_group_name, ]
+
+    # only the columns combined below
+    partitioned = {
+        Storage.bronze_oracle_employees: [Fields.date] + employee_cols + item_cols,
+        Storage.bronze_oracle_guests: [Fields.date] + employee_cols,
+    }
+    # datasets combined for their business dates only, listed from the partition names
+    dated = [Storage.bronze_yesterday_reservations]
+    files = {
+        Storage.bronze_ga_daily: [Fields.date],
+        Storage.bronze_forecast: [Fields.date],
+        Storage.bronze_future_reservations: [Fields.date],
+    }
 
     datasets = []
-    for f in files:
-        tmp_df = read_parquet(container=Storage.bronze, file_path=f)
+    for d, columns in partitioned.items():
+        tmp_df = read_dataset(container=Storage.bronze, dataset_path=d, columns=columns)
+        datasets.append(tmp_df)
+    for d in dated:
+        tmp_df = list_partition_dates(container=Storage.bronze, dataset_path=d).to_frame(index=False)
+        datasets.append(tmp_df)
+    for f, columns in files.items():
+        tmp_df = read_parquet(container=Storage.bronze, file_path=f, columns=columns)
         datasets.append(tmp_df)
 
     return datasets